@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark du pipeline de captures sur un site synthétique local.
+
+Lance un serveur HTTP qui imite un vrai site (sitemap ou index de sitemaps,
+ressources lentes, bannière de consentement compatible avec
+COOKIE_BUTTON_SELECTOR, zone protégée par cookie de connexion), puis mesure
+la découverte et la capture : pages/seconde, percentiles de latence par page
+et pic de mémoire (processus + navigateurs enfants).
+
+    python benchmarks/bench_capture.py --pages 200 --sitemap index --workers 4
+    python benchmarks/bench_capture.py --pages 5000 --sitemap none --skip-capture
+"""
+
+import argparse
+import gzip
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import capture_pipeline  # noqa: E402
+
+LOGIN_COOKIE = ("bench_session", "ok")
+SITEMAP_CHUNK = 1000  # URLs par sitemap enfant en mode index
+
+# Reprend les classes de COOKIE_BUTTON_SELECTOR pour que le bouton soit trouvé
+CONSENT_BANNER = """
+<div id="consent" style="position:fixed;bottom:0;left:0;right:0;padding:20px;background:#222;">
+  <button class="{classes}" onclick="document.getElementById('consent').remove()">OK</button>
+</div>
+""".format(classes=capture_pipeline.COOKIE_BUTTON_SELECTOR.split("button.", 1)[1].replace(".", " "))
+
+
+# ─────────────────────────────────────────────────────────────
+# SITE SYNTHÉTIQUE
+# ─────────────────────────────────────────────────────────────
+class SyntheticSite:
+    """Paramètres du site servi par `SiteHandler`"""
+
+    def __init__(self, pages, sitemap="flat", asset_delay=0.0, consent=True, private_pages=0, links=5):
+        self.pages = pages
+        self.sitemap = sitemap  # flat, index, gzip, none
+        self.asset_delay = asset_delay
+        self.consent = consent
+        self.private_pages = private_pages
+        self.links = links
+
+    def page_html(self, i, prefix="page"):
+        links = "".join(
+            f'<li><a href="/{prefix}/{(i * 7 + k + 1) % self.pages}">Lien {k}</a></li>'
+            for k in range(self.links)
+        )
+        return f"""<!doctype html>
+<html><head><title>{prefix} {i}</title>
+<link rel="stylesheet" href="/assets/style.css?{i}"></head>
+<body>
+<h1>{prefix.capitalize()} {i}</h1>
+<p>{"Lorem ipsum dolor sit amet. " * 40}</p>
+<img src="/assets/image.png?{i}" width="600" height="300">
+<ul>{links}</ul>
+{CONSENT_BANNER if self.consent else ""}
+</body></html>"""
+
+
+def make_handler(site):
+    """Construit le gestionnaire HTTP qui sert `site`"""
+
+    def base(handler):
+        return f"http://{handler.headers.get('Host')}"
+
+    def urlset(handler, paths):
+        urls = "".join(f"<url><loc>{base(handler)}/{path}</loc></url>" for path in paths)
+        return f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'
+
+    class SiteHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, status, body, content_type="text/html; charset=utf-8", headers=None):
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+
+        def do_HEAD(self):
+            self.do_GET()
+
+        def do_GET(self):
+            path = urlparse(self.path).path.strip("/")
+            public = [f"page/{i}" for i in range(site.pages)]
+
+            if path == "robots.txt":
+                if site.sitemap == "none":
+                    return self.send(200, "User-agent: *\n", "text/plain")
+                name = {"index": "sitemap_index.xml", "gzip": "sitemap.xml.gz"}.get(site.sitemap, "sitemap.xml")
+                return self.send(200, f"User-agent: *\nSitemap: {base(self)}/{name}\n", "text/plain")
+
+            if site.sitemap != "none" and path == "sitemap.xml":
+                return self.send(200, urlset(self, public), "application/xml")
+            if site.sitemap == "gzip" and path == "sitemap.xml.gz":
+                return self.send(200, gzip.compress(urlset(self, public).encode()), "application/gzip")
+            if site.sitemap == "index" and path == "sitemap_index.xml":
+                children = "".join(
+                    f"<sitemap><loc>{base(self)}/sitemap_{n}.xml.gz</loc></sitemap>"
+                    for n in range(0, site.pages, SITEMAP_CHUNK)
+                )
+                return self.send(200, f'<?xml version="1.0"?><sitemapindex '
+                                      f'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{children}</sitemapindex>',
+                                 "application/xml")
+            if site.sitemap == "index" and path.startswith("sitemap_") and path.endswith(".xml.gz"):
+                start = int(path[len("sitemap_"):-len(".xml.gz")])
+                body = gzip.compress(urlset(self, public[start:start + SITEMAP_CHUNK]).encode())
+                return self.send(200, body, "application/gzip")
+
+            if path.startswith("assets/"):
+                time.sleep(site.asset_delay)
+                if path.endswith(".css"):
+                    return self.send(200, "body{font-family:sans-serif;margin:40px}", "text/css")
+                return self.send(200, b"\x89PNG\r\n\x1a\n", "image/png")
+
+            if path in ("", "index.html"):
+                return self.send(200, site.page_html(0))
+            if path.startswith("page/"):
+                i = int(path.split("/")[1])
+                if i < site.pages:
+                    return self.send(200, site.page_html(i), headers={"ETag": f'"page-{i}"'})
+            if path.startswith("private/"):
+                if f"{LOGIN_COOKIE[0]}={LOGIN_COOKIE[1]}" not in self.headers.get("Cookie", ""):
+                    return self.send(302, "", headers={"Location": "/login"})
+                return self.send(200, site.page_html(int(path.split("/")[1]), prefix="private"))
+            if path == "login":
+                return self.send(200, "<form><input name=user><button>Connexion</button></form>")
+
+            return self.send(404, "Not found")
+
+    return SiteHandler
+
+
+def serve(site):
+    """Démarre le serveur sur un port libre, retourne (serveur, URL de base)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(site))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/"
+
+
+# ─────────────────────────────────────────────────────────────
+# MESURES
+# ─────────────────────────────────────────────────────────────
+def tree_rss_mb(pid=None):
+    """RSS cumulé du processus et de ses descendants (Linux), en Mo"""
+    pid = pid or os.getpid()
+    children = {}
+    rss = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        rss[int(entry)] = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        total += rss.get(current, 0)
+        stack.extend(children.get(current, []))
+    return total / (1024 * 1024)
+
+
+class PeakMemory:
+    """Échantillonne le RSS de l'arbre de processus pendant un bloc `with`"""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            try:
+                self.peak_mb = max(self.peak_mb, tree_rss_mb())
+            except OSError:
+                pass
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if os.path.isdir("/proc"):
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if os.path.isdir("/proc"):
+            self._thread.join()
+        else:
+            self.peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def summarize(latencies_ms):
+    return {
+        "p50_ms": capture_pipeline.percentile(latencies_ms, 50),
+        "p95_ms": capture_pipeline.percentile(latencies_ms, 95),
+        "max_ms": max(latencies_ms) if latencies_ms else None,
+    }
+
+
+def bench_discovery(base_url, expected):
+    timings = {}
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        pages = capture_pipeline.discover_site_pages(base_url, max_pages=expected, timings=timings)
+        elapsed = time.perf_counter() - start
+    return {
+        "pages": len(pages),
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(len(pages) / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": round(memory.peak_mb, 1),
+        "timings": timings,
+    }, pages
+
+
+def bench_capture(base_url, pages, workers, cookies=None, block=None):
+    out_dir = tempfile.mkdtemp(prefix="bench_captures_")
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        log = capture_pipeline.capture_screens(pages, base_url, authenticated=bool(cookies),
+                                               out_dir=out_dir, cookies=cookies, workers=workers,
+                                               block=block)
+        elapsed = time.perf_counter() - start
+
+    captured = [entry for entry in log if entry["Status"] == "Captured"]
+    return {
+        "pages": len(log),
+        "captured": len(captured),
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(len(captured) / elapsed, 2) if elapsed else None,
+        "latency": summarize([entry["total (ms)"] for entry in captured]),
+        "peak_rss_mb": round(memory.peak_mb, 1),
+        "phases": capture_pipeline.timing_report(captured)["phases"],
+        "resources": capture_pipeline.timing_report(captured).get("resources"),
+        "out_dir": out_dir,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark découverte + captures sur un site local")
+    parser.add_argument("--pages", type=int, default=100, help="pages publiques du site synthétique")
+    parser.add_argument("--sitemap", choices=["flat", "index", "gzip", "none"], default="flat")
+    parser.add_argument("--asset-delay", type=float, default=0.0, help="latence des images/CSS (s)")
+    parser.add_argument("--no-consent", action="store_true", help="sans bannière de consentement")
+    parser.add_argument("--private-pages", type=int, default=0, help="pages protégées par cookie")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--capture-pages", type=int, default=20, help="pages à capturer (0 = toutes)")
+    parser.add_argument("--block", choices=list(capture_pipeline.BLOCK_PROFILES), default="aucun",
+                        help="profil de blocage des ressources pendant la capture")
+    parser.add_argument("--skip-capture", action="store_true", help="ne mesurer que la découverte")
+    parser.add_argument("--json", help="écrire les résultats dans ce fichier")
+    args = parser.parse_args(argv)
+
+    site = SyntheticSite(args.pages, args.sitemap, args.asset_delay, not args.no_consent, args.private_pages)
+    server, base_url = serve(site)
+    results = {"site": vars(site), "workers": args.workers}
+
+    try:
+        results["discovery"], pages = bench_discovery(base_url, args.pages)
+        if not args.skip_capture:
+            todo = pages[:args.capture_pages] if args.capture_pages else pages
+            block = capture_pipeline.BLOCK_PROFILES[args.block]
+            results["capture"] = bench_capture(base_url, todo, args.workers, block=block)
+            if args.private_pages:
+                private = [f"private/{i}" for i in range(args.private_pages)]
+                results["capture_authenticated"] = bench_capture(
+                    base_url, private, args.workers, cookies=dict([LOGIN_COOKIE]), block=block
+                )
+    finally:
+        server.shutdown()
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    print(output)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2188 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline de captures d'écran, utilisable sans Streamlit.
+
+Découverte des pages (sitemaps, crawler), capture avec un pool de Chrome
+headless, mode incrémental et manifeste de reprise. Utilisé par
+`pages/1_captures.py` et en ligne de commande :
+
+    python capture_pipeline.py https://exemple.com --workers 4 --out captures
+"""
+
+import argparse
+import asyncio
+import atexit
+import base64
+import csv
+import hashlib
+import json
+import math
+import os
+import re
+import socket
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import uuid
+import weakref
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+from datetime import datetime
+from io import BytesIO
+from urllib.parse import urljoin, urlparse
+
+import requests
+from bs4 import BeautifulSoup
+import pandas as pd
+from PIL import Image
+from requests.adapters import HTTPAdapter
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+
+# ─────────────────────────────────────────────────────────────
+# ⚙️ CONFIGURATION
+# ─────────────────────────────────────────────────────────────
+COOKIE_BUTTON_SELECTOR = "button.cm-btn.cm-btn-success.cm-btn-info.cm-btn-accept"
+WINDOW_SIZE = (1920, 1080)
+VIEWPORT_HEIGHTS = {1920: 1080, 1440: 900, 1366: 768, 1024: 768, 768: 1024, 414: 896, 375: 812, 360: 800}
+VIEWPORT_SETTLE_MAX_WAIT = 3  # Stabilisation après redimensionnement (s)
+FULL_PAGE_TILE_HEIGHT = 2000  # Hauteur des tuiles en capture pleine page (px)
+FULL_PAGE_MAX_HEIGHT = 50000  # Au-delà, la page est tronquée (défilement infini)
+PNG_STREAM_LEVEL = 6
+DRIVER_MAX_PAGES = 50  # Recycler un navigateur après N pages
+BROWSER_RAM_MB = 400  # Mémoire estimée par Chrome headless
+SETTLE_MAX_WAIT = 10  # Attente maximale de stabilisation d'une page (s)
+SETTLE_QUIET = 0.3  # Durée sans mutation DOM ni requête réseau (s)
+SETTLE_POLL = 0.1
+CONSENT_WAIT = 3  # Attente de la bannière sur un site pas encore connu (s)
+HTTP_POOL_SIZE = 16
+SITEMAP_WORKERS = 8  # Sitemaps enfants téléchargés en parallèle
+SITEMAP_CHUNK_SIZE = 64 * 1024
+CRAWL_MAX_DEPTH = 3
+CRAWL_MAX_PAGES = 5000
+CRAWL_CONCURRENCY = 16
+SKIP_EXTENSIONS = ('jpg', 'png', 'pdf', 'css', 'js')
+PAGE_LOAD_TIMEOUT = 30  # Délai maximal de chargement d'une page (s)
+ERROR_MESSAGE_LENGTH = 200
+PREFLIGHT_WORKERS = 16
+PREFLIGHT_TIMEOUT = 5  # s
+PREFLIGHT_HEAD_BYTES = 64 * 1024  # Lecture maximale pour trouver rel=canonical
+CAPTURE_INDEX_FILE = "capture_index.json"
+CAPTURE_MANIFEST_FILE = "capture_manifest.sqlite"
+CAPTURE_ARCHIVE_FILE = "captures.zip"
+QUEUE_LEASE = 300  # Bail d'une page réservée par un worker (s), renouvelé tant qu'il vit
+QUEUE_POLL = 5  # Attente d'un worker quand toutes les pages restantes sont réservées (s)
+QUEUE_MAX_CLAIMS = 3  # Réservations expirées avant de déclarer une page en échec
+SESSIONS_DIR = "sessions"  # Sessions de connexion enregistrées, une par hôte
+JOBS_TTL = 3600  # Durée de conservation d'une tâche terminée (s)
+JOBS_MAX_FINISHED = 20  # Tâches terminées gardées au plus
+
+
+# ─────────────────────────────────────────────────────────────
+# CHRONOMÉTRAGE
+# ─────────────────────────────────────────────────────────────
+TIMING_PHASES = ("http", "driver", "cookies", "navigation", "settle", "consent", "screenshot", "encode", "write")
+
+
+class PhaseTimer:
+    """Cumule la durée (ms) de chaque phase de la capture d'une page"""
+
+    def __init__(self):
+        self.phases = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.phases[name] = self.phases.get(name, 0) + elapsed
+
+    def columns(self):
+        """Colonnes de log `<phase> (ms)` + total"""
+        columns = {f"{name} (ms)": round(self.phases.get(name, 0), 1) for name in TIMING_PHASES}
+        columns["total (ms)"] = round((time.perf_counter() - self._start) * 1000, 1)
+        return columns
+
+
+def percentile(values, p):
+    """Percentile par rang le plus proche"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def timing_report(log, discovery=None):
+    """Résumé p50/p95/moyenne/total par phase, sur les pages réellement traitées"""
+    summary = {}
+    for column in [f"{name} (ms)" for name in TIMING_PHASES] + ["total (ms)"]:
+        values = [entry[column] for entry in log if entry.get(column) is not None]
+        if not values:
+            continue
+        summary[column[:-5]] = {
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "mean": round(sum(values) / len(values), 1),
+            "total": round(sum(values), 1),
+        }
+    report = {
+        "pages": len(log),
+        "statuses": dict(Counter(entry["Status"].split(":")[0] for entry in log)),
+        "phases": summary,
+        "discovery": discovery or {},
+    }
+    if any("output (KB)" in entry for entry in log):
+        raw = sum(entry.get("raw (KB)", 0) for entry in log)
+        output = sum(entry.get("output (KB)", 0) for entry in log)
+        report["output"] = {
+            "raw_kb": round(raw, 1),
+            "output_kb": round(output, 1),
+            "ratio": round(output / raw, 3) if raw else None,
+        }
+    if any("blocked requests" in entry for entry in log):
+        report["resources"] = {
+            "blocked_requests": sum(entry.get("blocked requests", 0) for entry in log),
+            "transferred_kb": round(sum(entry.get("transferred (KB)", 0) for entry in log), 1),
+        }
+    return report
+
+
+def write_timing_report(log, out_dir, discovery=None):
+    """Écrit timing_report.json (résumé) et timings.csv (détail par page)"""
+    os.makedirs(out_dir, exist_ok=True)
+    report = timing_report(log, discovery)
+    with open(os.path.join(out_dir, "timing_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    columns = (["Page", "URL", "Status", "Time"] + [f"{name} (ms)" for name in TIMING_PHASES]
+               + ["total (ms)", "blocked requests", "transferred (KB)", "raw (KB)", "output (KB)"])
+    with open(os.path.join(out_dir, "timings.csv"), "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(log)
+    return report
+
+
+# ─────────────────────────────────────────────────────────────
+# CAPTURE PLEINE PAGE
+# ─────────────────────────────────────────────────────────────
+class PngStreamWriter:
+    """Écrit un PNG RGB bande par bande, sans garder l'image entière en mémoire"""
+
+    def __init__(self, f, width, height):
+        self.f = f
+        self.width = width
+        self._z = zlib.compressobj(PNG_STREAM_LEVEL)
+        f.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self.f.write(struct.pack(">I", len(data)) + kind + data)
+        self.f.write(struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    def write_rows(self, image):
+        """Ajoute les lignes d'une image PIL (de largeur `width`)"""
+        data = image.convert("RGB").tobytes()
+        stride = self.width * 3
+        # Filtre PNG 0 (aucun) en tête de chaque ligne
+        raw = b"".join(b"\x00" + data[i:i + stride] for i in range(0, len(data), stride))
+        compressed = self._z.compress(raw)
+        if compressed:
+            self._chunk(b"IDAT", compressed)
+
+    def close(self):
+        self._chunk(b"IDAT", self._z.flush())
+        self._chunk(b"IEND", b"")
+
+
+PAGE_SIZE_SCRIPT = """
+    var d = document.documentElement, b = document.body || d;
+    return [d.clientWidth, Math.max(d.scrollHeight, b.scrollHeight)];
+"""
+
+
+def capture_full_page(driver, filename, tile_height=FULL_PAGE_TILE_HEIGHT, max_height=FULL_PAGE_MAX_HEIGHT):
+    """Capture toute la hauteur de la page dans `filename`, par tuiles assemblées au fil de l'eau.
+
+    Chaque tuile est découpée via DevTools (Page.captureScreenshot + clip)
+    sans faire défiler la page : les en-têtes fixes/collants n'apparaissent
+    qu'une fois, et une page qui ne défile pas (modale ouverte) est capturée
+    quand même. `driver` est un Chrome, comme ceux de `build_driver`.
+    """
+    width, height = driver.execute_script(PAGE_SIZE_SCRIPT)
+    height = max(1, min(height, max_height))
+
+    with open(filename, "wb") as f:
+        writer = PngStreamWriter(f, width, height)
+        for y in range(0, height, tile_height):
+            h = min(tile_height, height - y)
+            shot = driver.execute_cdp_cmd("Page.captureScreenshot", {
+                "format": "png",
+                "captureBeyondViewport": True,
+                "clip": {"x": 0, "y": y, "width": width, "height": h, "scale": 1},
+            })
+            with Image.open(BytesIO(base64.b64decode(shot["data"]))) as tile:
+                writer.write_rows(tile.crop((0, 0, width, h)))
+        writer.close()
+    return width, height
+
+
+# ─────────────────────────────────────────────────────────────
+# FORMATS DE SORTIE
+# ─────────────────────────────────────────────────────────────
+OutputFormat = namedtuple("OutputFormat", "format quality compress_level lossless grayscale scale",
+                          defaults=(None, None, False, False, 1.0))
+OutputFormat.__doc__ = """Encodage des captures : format PIL, qualité/compression, niveaux de gris, échelle"""
+
+OUTPUT_FORMATS = {
+    "png": OutputFormat("PNG"),  # Octets du navigateur écrits tels quels
+    "png rapide": OutputFormat("PNG", compress_level=1),
+    "png compact": OutputFormat("PNG", compress_level=9),
+    "webp sans perte": OutputFormat("WEBP", lossless=True),
+    "webp": OutputFormat("WEBP", quality=80),
+    "jpeg": OutputFormat("JPEG", quality=85),
+    "miniature": OutputFormat("WEBP", quality=70, grayscale=True, scale=0.25),
+}
+FORMAT_EXTENSIONS = {"PNG": "png", "WEBP": "webp", "JPEG": "jpg"}
+
+
+def encode_screenshot(png, output):
+    """Réencode le PNG brut du navigateur selon `output` (None : inchangé)"""
+    if output is None or output == OUTPUT_FORMATS["png"]:
+        return png
+
+    with Image.open(BytesIO(png)) as image:
+        if output.scale != 1:
+            size = (max(1, round(image.width * output.scale)), max(1, round(image.height * output.scale)))
+            image = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+        if output.grayscale:
+            image = image.convert("L")
+        elif output.format == "JPEG":
+            image = image.convert("RGB")
+
+        options = {}
+        if output.format == "PNG":
+            options["compress_level"] = 6 if output.compress_level is None else output.compress_level
+        elif output.format == "WEBP" and output.lossless:
+            options.update(lossless=True, method=4)
+        elif output.quality is not None:
+            options["quality"] = output.quality
+
+        buffer = BytesIO()
+        image.save(buffer, output.format, **options)
+        return buffer.getvalue()
+
+
+# ─────────────────────────────────────────────────────────────
+# BLOCAGE DE RESSOURCES
+# ─────────────────────────────────────────────────────────────
+ResourceBlocking = namedtuple("ResourceBlocking", "types hosts")
+ResourceBlocking.__doc__ = """Profil de blocage : types de ressources et hôtes tiers à ne pas charger"""
+
+RESOURCE_PATTERNS = {
+    "image": ("png", "jpg", "jpeg", "gif", "webp", "avif", "svg", "ico"),
+    "font": ("woff", "woff2", "ttf", "otf", "eot"),
+    "media": ("mp4", "webm", "ogg", "mp3", "m3u8", "mov"),
+}
+TRACKER_HOSTS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "facebook.net", "connect.facebook.com", "hotjar.com", "clarity.ms", "criteo.com",
+    "adservice.google.com", "scorecardresearch.com", "taboola.com", "outbrain.com",
+)
+BLOCK_PROFILES = {
+    "aucun": None,
+    "mise en page": ResourceBlocking(("image", "font", "media"), TRACKER_HOSTS),
+    "sans traceurs": ResourceBlocking((), TRACKER_HOSTS),
+}
+
+
+def blocked_url_patterns(block):
+    """Motifs pour Network.setBlockedURLs (les `*` sont des jokers)"""
+    patterns = []
+    for resource_type in block.types:
+        for extension in RESOURCE_PATTERNS.get(resource_type, ()):
+            patterns += [f"*.{extension}", f"*.{extension}?*"]
+    patterns += [f"*{host}/*" for host in block.hosts]
+    return patterns
+
+
+def resource_stats(driver):
+    """Requêtes bloquées et octets transférés depuis le dernier appel (journal performance)"""
+    blocked, transferred = 0, 0
+    for record in driver.get_log("performance"):
+        message = json.loads(record["message"])["message"]
+        if message["method"] == "Network.loadingFailed" and message["params"].get("blockedReason"):
+            blocked += 1
+        elif message["method"] == "Network.loadingFinished":
+            transferred += message["params"].get("encodedDataLength", 0)
+    return {"blocked requests": blocked, "transferred (KB)": round(transferred / 1024, 1)}
+
+
+# ─────────────────────────────────────────────────────────────
+# SESSIONS AUTHENTIFIÉES
+# ─────────────────────────────────────────────────────────────
+def cookie_jar(cookies, base_url=None):
+    """Normalise des cookies en liste complète (domaine, chemin, expiration, drapeaux).
+
+    Accepte un dict {nom: valeur} (rattaché à l'hôte de `base_url`) ou une
+    liste exportée par Selenium (`driver.get_cookies()`). Les cookies
+    expirés sont écartés.
+    """
+    if not cookies:
+        return []
+    if isinstance(cookies, dict):
+        host = urlparse(base_url).hostname if base_url else None
+        cookies = [{"name": name, "value": value, "path": "/", **({"domain": host} if host else {})}
+                   for name, value in cookies.items()]
+    now = time.time()
+    return [dict(cookie) for cookie in cookies if not cookie.get("expiry") or cookie["expiry"] > now]
+
+
+def cdp_cookie(cookie, url):
+    """Cookie Selenium -> paramètres de Network.setCookies"""
+    params = {
+        "name": cookie["name"],
+        "value": cookie["value"],
+        "path": cookie.get("path", "/"),
+        "secure": bool(cookie.get("secure")),
+        "httpOnly": bool(cookie.get("httpOnly")),
+    }
+    if cookie.get("domain"):
+        params["domain"] = cookie["domain"]
+    else:
+        params["url"] = url
+    if cookie.get("expiry"):
+        params["expires"] = cookie["expiry"]
+    if cookie.get("sameSite"):
+        params["sameSite"] = cookie["sameSite"]
+    return params
+
+
+def inject_cookies(driver, jar, url):
+    """Pose les cookies avant la navigation, sans charger la page une première fois"""
+    try:
+        driver.execute_cdp_cmd("Network.setCookies", {"cookies": [cdp_cookie(cookie, url) for cookie in jar]})
+        return
+    except (AttributeError, WebDriverException):
+        pass
+    # Sans CDP, Selenium n'accepte un cookie que depuis une page de son domaine
+    driver.get(url)
+    for cookie in jar:
+        try:
+            driver.add_cookie(cookie)
+        except WebDriverException:
+            pass
+
+
+def requests_cookies(jar):
+    """Cookies complets -> RequestsCookieJar, pour les requêtes HTTP hors navigateur"""
+    result = requests.cookies.RequestsCookieJar()
+    for cookie in jar:
+        result.set(cookie["name"], cookie["value"], domain=cookie.get("domain", ""),
+                   path=cookie.get("path", "/"), secure=bool(cookie.get("secure")),
+                   expires=cookie.get("expiry"), rest={"HttpOnly": None} if cookie.get("httpOnly") else {})
+    return result
+
+
+def session_path(base_url, sessions_dir=SESSIONS_DIR):
+    """Fichier de session enregistrée pour l'hôte de `base_url`"""
+    host = urlparse(base_url).netloc or base_url
+    return os.path.join(sessions_dir, host.replace(":", "_") + ".json")
+
+
+def save_session(cookies, path):
+    """Enregistre le jar complet pour réutiliser la connexion lors des prochaines exécutions"""
+    os.makedirs(os.path.dirname(path) or ".", mode=0o700, exist_ok=True)
+    tmp = path + ".tmp"
+    # Cookies d'authentification : lisibles par le seul propriétaire, quel que soit l'umask
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    if hasattr(os, "fchmod"):
+        os.fchmod(fd, 0o600)  # Fichier .tmp laissé par une écriture interrompue
+    with open(fd, "w", encoding="utf-8") as f:
+        json.dump({"saved_at": datetime.now().isoformat(timespec="seconds"), "cookies": cookie_jar(cookies)},
+                  f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def load_session(path):
+    """Jar enregistré par save_session (cookies expirés écartés), ou None"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cookie_jar(data.get("cookies")) or None
+
+
+# ─────────────────────────────────────────────────────────────
+# POOL DE NAVIGATEURS
+# ─────────────────────────────────────────────────────────────
+def build_driver(headless=True, block=None):
+    """Lance un nouveau Chrome configuré pour la capture.
+
+    Avec un profil `block`, les ressources correspondantes sont bloquées via
+    DevTools pour toute la vie du navigateur, et le journal réseau est activé
+    pour les statistiques.
+    """
+    o = Options()
+    o.add_argument("--no-sandbox")
+    o.add_argument("--disable-gpu")
+    if headless:
+        o.add_argument("--headless")
+    if block:
+        o.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+    driver = webdriver.Chrome(options=o)
+    driver.set_window_size(*WINDOW_SIZE)
+    if block:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked_url_patterns(block)})
+    return driver
+
+
+_pools = weakref.WeakSet()  # Pools vivants, fermés à la sortie du processus
+
+
+@atexit.register
+def _close_pools():
+    for pool in list(_pools):
+        pool.close(force=True)
+
+
+class DriverPool:
+    """Pool de navigateurs Chrome réutilisés d'une page à l'autre.
+
+    Un navigateur est recyclé (quit + relance) après `max_pages` pages
+    ou dès qu'il ne répond plus. Les navigateurs sont regroupés par
+    configuration (headless, profil de blocage).
+    """
+
+    def __init__(self, max_pages=DRIVER_MAX_PAGES):
+        self.max_pages = max_pages
+        self.launched = 0
+        self.closed = False
+        self._idle = defaultdict(list)
+        self._meta = {}  # id(driver) -> [driver, (headless, block), pages]
+        self._lock = threading.Lock()
+        _pools.add(self)
+
+    @staticmethod
+    def _alive(driver):
+        try:
+            driver.window_handles
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _discard(self, driver):
+        """Retire le navigateur du pool puis le ferme, hors du verrou : l'arrêt de
+        Chrome (ou un chromedriver bloqué) ne fait pas attendre les autres workers"""
+        with self._lock:
+            self._meta.pop(id(driver), None)
+        self._quit(driver)
+
+    def acquire(self, headless=True, block=None):
+        """Retourne un navigateur chaud, ou en lance un nouveau"""
+        key = (headless, block)
+        while True:
+            with self._lock:
+                driver = self._idle[key].pop() if self._idle[key] else None
+            if driver is None:
+                break
+            if self._alive(driver):
+                return driver
+            self._discard(driver)
+
+        driver = build_driver(headless, block)
+        with self._lock:
+            self._meta[id(driver)] = [driver, key, 0]
+            self.launched += 1
+        return driver
+
+    def release(self, driver, failed=False, recycle=False):
+        """Rend un navigateur au pool (ou le ferme s'il est usé, planté, à `recycle`
+        ou si le pool a été fermé pendant qu'il était emprunté)"""
+        with self._lock:
+            meta = self._meta.get(id(driver))
+            if meta is None:
+                return
+            meta[2] += 1
+            worn = recycle or self.closed or meta[2] >= self.max_pages
+        if worn or (failed and not self._alive(driver)):
+            self._discard(driver)
+            return
+
+        try:
+            driver.delete_all_cookies()
+            driver.set_window_size(*WINDOW_SIZE)
+        except Exception:
+            self._discard(driver)
+            return
+
+        with self._lock:
+            if not self.closed:
+                self._idle[meta[1]].append(driver)
+                return
+        self._discard(driver)
+
+    @contextmanager
+    def lease(self, headless=True, block=None):
+        """Emprunte un navigateur le temps d'un bloc `with`"""
+        driver = self.acquire(headless, block)
+        failed = False
+        try:
+            yield driver
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(driver, failed=failed)
+
+    def close(self, force=False):
+        """Ferme les navigateurs inactifs ; ceux encore empruntés (tâche en cours,
+        fenêtre de connexion) sont fermés à leur retour. `force` les ferme tous."""
+        with self._lock:
+            self.closed = True
+            if force:
+                to_close = [meta[0] for meta in self._meta.values()]
+            else:
+                to_close = [driver for drivers in self._idle.values() for driver in drivers]
+            self._idle = defaultdict(list)
+            for driver in to_close:
+                self._meta.pop(id(driver), None)
+        for driver in to_close:
+            self._quit(driver)
+
+
+# ─────────────────────────────────────────────────────────────
+# RÉSILIENCE
+# ─────────────────────────────────────────────────────────────
+ResiliencePolicy = namedtuple(
+    "ResiliencePolicy",
+    "page_load_timeout retries backoff backoff_max breaker_threshold breaker_cooldown breaker_abort",
+    defaults=(PAGE_LOAD_TIMEOUT, 2, 1.0, 30.0, 5, 60.0, False)
+)
+
+# Fragments de message Selenium qui signalent une erreur réseau ou un navigateur planté
+TRANSIENT_MARKERS = ("net::err_", "timeout", "timed out", "disconnected", "not reachable",
+                     "invalid session id", "connection refused", "connection reset")
+
+
+class CircuitOpenError(Exception):
+    """Hôte coupé après trop d'échecs consécutifs"""
+
+
+def is_transient_error(error):
+    """Erreur susceptible de disparaître en réessayant (délai, réseau, navigateur planté)"""
+    if isinstance(error, (TimeoutException, requests.ConnectionError, requests.Timeout)):
+        return True
+    message = str(error).lower()
+    return isinstance(error, WebDriverException) and any(marker in message for marker in TRANSIENT_MARKERS)
+
+
+def error_message(error, limit=ERROR_MESSAGE_LENGTH):
+    """Message d'erreur lisible pour le log : type et première ligne non vide"""
+    text = getattr(error, "msg", None) or str(error)
+    first_line = next((line.strip() for line in text.splitlines() if line.strip()), "")
+    return f"{type(error).__name__}: {first_line}"[:limit]
+
+
+class CircuitBreaker:
+    """Coupe-circuit par hôte, partagé par tous les workers d'une exécution.
+
+    Après `threshold` pages consécutives en échec, l'hôte est suspendu `cooldown`
+    secondes (les captures suivantes attendent) puis réessayé : un seul
+    nouvel échec le recoupe. Avec `abort`, les pages restantes de l'hôte
+    échouent immédiatement.
+    """
+
+    def __init__(self, threshold=5, cooldown=60.0, abort=False):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.abort = abort
+        self._failures = defaultdict(int)
+        self._open_until = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_policy(cls, policy):
+        return cls(policy.breaker_threshold, policy.breaker_cooldown, policy.breaker_abort)
+
+    def before(self, host):
+        """Attend la fin de la pause, ou lève CircuitOpenError en mode abandon"""
+        with self._lock:
+            open_until = self._open_until.get(host)
+        if open_until is None:
+            return
+        if self.abort:
+            raise CircuitOpenError(f"circuit ouvert pour {host} après {self.threshold} échecs consécutifs")
+        remaining = open_until - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def success(self, host):
+        with self._lock:
+            self._failures[host] = 0
+            self._open_until.pop(host, None)
+
+    def failure(self, host):
+        with self._lock:
+            self._failures[host] += 1
+            if self._failures[host] >= self.threshold:
+                self._open_until[host] = time.monotonic() + self.cooldown
+                self._failures[host] = self.threshold - 1
+
+    def is_open(self, host):
+        with self._lock:
+            return host in self._open_until
+
+
+# ─────────────────────────────────────────────────────────────
+# STABILISATION DES PAGES
+# ─────────────────────────────────────────────────────────────
+# Activité réseau : le PerformanceObserver voit chaque ressource terminée (sans la
+# limite du tampon de Resource Timing, 250 entrées par défaut dans Chrome) et
+# fetch / XMLHttpRequest sont instrumentés pour compter les requêtes en cours.
+SETTLE_SCRIPT = """
+    if (!window.__settle) {
+        var settle = window.__settle = {dom: performance.now(), network: performance.now(), pending: 0};
+        var activity = function () { settle.network = performance.now(); };
+        var done = function () { settle.pending = Math.max(settle.pending - 1, 0); activity(); };
+        new MutationObserver(function () {
+            settle.dom = performance.now();
+        }).observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+        if (performance.setResourceTimingBufferSize) {
+            performance.setResourceTimingBufferSize(100000);
+        }
+        if (window.PerformanceObserver) {
+            try {
+                new PerformanceObserver(activity).observe({type: 'resource', buffered: true});
+            } catch (e) {}
+        }
+        if (window.fetch) {
+            var fetch = window.fetch;
+            window.fetch = function () {
+                settle.pending++;
+                activity();
+                return fetch.apply(this, arguments).finally(done);
+            };
+        }
+        var send = XMLHttpRequest.prototype.send;
+        XMLHttpRequest.prototype.send = function () {
+            settle.pending++;
+            activity();
+            this.addEventListener('loadend', done);
+            return send.apply(this, arguments);
+        };
+    }
+    return [
+        document.readyState,
+        performance.now() - window.__settle.dom,
+        performance.now() - window.__settle.network,
+        window.__settle.pending
+    ];
+"""
+
+
+def settle_page(driver, max_wait=SETTLE_MAX_WAIT, quiet=SETTLE_QUIET):
+    """Attend que la page soit chargée, que le réseau et le DOM soient au repos.
+
+    Le réseau est au repos quand aucune requête fetch/XHR n'est en cours et
+    qu'aucune ressource ne s'est terminée depuis `quiet` secondes. Retourne
+    False si le plafond `max_wait` est atteint avant.
+    """
+    deadline = time.monotonic() + max_wait
+    quiet_ms = quiet * 1000
+
+    while time.monotonic() < deadline:
+        try:
+            state, dom_idle_ms, network_idle_ms, pending = driver.execute_script(SETTLE_SCRIPT)
+        except WebDriverException:
+            # Navigation encore en cours
+            time.sleep(SETTLE_POLL)
+            continue
+
+        if state == "complete" and not pending and dom_idle_ms >= quiet_ms and network_idle_ms >= quiet_ms:
+            return True
+        time.sleep(SETTLE_POLL)
+
+    return False
+
+
+def dismiss_consent(driver, url, memory):
+    """Accepte la bannière de cookies si présente.
+
+    `memory` retient par site si une bannière a déjà été vue : sur un site
+    connu sans bannière, on vérifie sans attendre.
+    """
+    host = urlparse(url).netloc
+
+    if memory.get(host) is False:
+        buttons = driver.find_elements(By.CSS_SELECTOR, COOKIE_BUTTON_SELECTOR)
+        if not buttons:
+            return False
+        button = buttons[0]
+    else:
+        try:
+            button = WebDriverWait(driver, CONSENT_WAIT).until(
+                EC.element_to_be_clickable((By.CSS_SELECTOR, COOKIE_BUTTON_SELECTOR))
+            )
+        except TimeoutException:
+            memory[host] = False
+            return False
+
+    memory[host] = True
+    try:
+        button.click()
+        WebDriverWait(driver, 1).until(
+            EC.invisibility_of_element_located((By.CSS_SELECTOR, COOKIE_BUTTON_SELECTOR))
+        )
+    except (TimeoutException, WebDriverException):
+        pass
+    settle_page(driver, max_wait=2)
+    return True
+
+
+# ─────────────────────────────────────────────────────────────
+# DÉCOUVERTE VIA SITEMAPS
+# ─────────────────────────────────────────────────────────────
+def http_session(pool_size=HTTP_POOL_SIZE, stats=None):
+    """Session requests avec un pool de connexions dimensionné pour le parallélisme.
+
+    Si `stats` est un dict, chaque réponse y incrémente `http_fetches` et
+    `http_ms` (temps jusqu'aux en-têtes).
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    if stats is not None:
+        lock = threading.Lock()
+
+        def count(response, *args, **kwargs):
+            with lock:
+                stats["http_fetches"] = stats.get("http_fetches", 0) + 1
+                stats["http_ms"] = round(stats.get("http_ms", 0) + response.elapsed.total_seconds() * 1000, 1)
+
+        session.hooks["response"].append(count)
+    return session
+
+
+def robots_sitemaps(session, base_url):
+    """Retourne les sitemaps déclarés par les directives `Sitemap:` de robots.txt"""
+    try:
+        response = session.get(urljoin(base_url, "/robots.txt"), timeout=5)
+    except requests.RequestException:
+        return []
+    if response.status_code != 200:
+        return []
+
+    sitemaps = []
+    for line in response.text.splitlines():
+        key, _, value = line.partition(":")
+        if key.strip().lower() == "sitemap" and value.strip():
+            sitemaps.append(urljoin(base_url, value.strip()))
+    return sitemaps
+
+
+def parse_sitemap(session, sitemap_url):
+    """Télécharge et analyse un sitemap en flux (gzip accepté).
+
+    Retourne (sitemaps enfants, URLs de pages). Le XML est décompressé et
+    analysé au fil des blocs reçus, et chaque élément est libéré aussitôt :
+    la mémoire ne dépend pas de la taille du fichier.
+    """
+    children, urls = [], []
+    parser = ET.XMLPullParser(events=("start", "end"))
+    decompressor = None
+    root = None
+
+    def consume():
+        nonlocal root
+        for event, elem in parser.read_events():
+            if root is None:
+                root = elem
+                continue
+            if event != "end":
+                continue
+
+            tag = elem.tag.rsplit("}", 1)[-1]
+            if tag == "loc" and elem.text:
+                if root.tag.endswith("sitemapindex"):
+                    children.append(elem.text.strip())
+                else:
+                    urls.append(elem.text.strip())
+            elif tag in ("url", "sitemap"):
+                root.clear()
+
+    with session.get(sitemap_url, timeout=10, stream=True) as response:
+        if response.status_code != 200:
+            return children, urls
+
+        for i, chunk in enumerate(response.iter_content(SITEMAP_CHUNK_SIZE)):
+            if i == 0 and chunk[:2] == b"\x1f\x8b":
+                # Sitemap .xml.gz (compression du fichier, pas du transport)
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            parser.feed(chunk)
+            consume()
+
+    parser.close()
+    consume()
+    return children, urls
+
+
+def discover_sitemap_pages(base_url, max_workers=SITEMAP_WORKERS, stats=None):
+    """Suit robots.txt, les index de sitemaps et leurs enfants en parallèle"""
+    pages = set()
+
+    with http_session(max_workers, stats) as session:
+        pending = robots_sitemaps(session, base_url) or [urljoin(base_url, "/sitemap.xml")]
+        seen = set(pending)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(parse_sitemap, session, url) for url in pending}
+            while futures:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        children, urls = future.result()
+                    except (requests.RequestException, ET.ParseError, zlib.error):
+                        continue
+
+                    for url in urls:
+                        path = urlparse(url).path
+                        if path.startswith('/'):
+                            path = path[1:]
+                        pages.add(path)
+
+                    for child in children:
+                        if child not in seen:
+                            seen.add(child)
+                            futures.add(executor.submit(parse_sitemap, session, child))
+
+    return pages
+
+
+# ─────────────────────────────────────────────────────────────
+# CRAWLER (fallback sans sitemap)
+# ─────────────────────────────────────────────────────────────
+def normalize_url(url, keep_query=False):
+    """Normalise une URL pour la déduplication (casse, port par défaut, fragment ;
+    query aussi, sauf avec `keep_query`)"""
+    parsed = urlparse(url)
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or "").lower()
+    if parsed.port and (scheme, parsed.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parsed.port}"
+    path = re.sub(r"/{2,}", "/", parsed.path) or "/"
+    query = f"?{parsed.query}" if keep_query and parsed.query else ""
+    return f"{scheme}://{host}{path}{query}"
+
+
+def extract_links(session, url):
+    """Télécharge une page HTML et retourne (URL finale, liens absolus), ou None"""
+    try:
+        response = session.get(url, timeout=5)
+    except requests.RequestException:
+        return None
+    if response.status_code != 200 or "text/html" not in response.headers.get("Content-Type", ""):
+        return None
+
+    soup = BeautifulSoup(response.content, 'html.parser')
+    links = [urljoin(response.url, link['href']) for link in soup.find_all('a', href=True)]
+    return response.url, links
+
+async def crawl_site_async(base_url, max_depth, max_pages, concurrency, stats=None):
+    """Parcours en largeur du site, niveau par niveau, limité à `concurrency` requêtes.
+
+    Le périmètre est l'hôte final de la page d'accueil, après redirection.
+    """
+    start = normalize_url(base_url)
+    host = urlparse(start).netloc
+    seen = {start}
+    frontier = [start]
+    pages = set()
+
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+
+    with http_session(concurrency, stats) as session, ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        async def fetch(url):
+            async with semaphore:
+                return await loop.run_in_executor(executor, extract_links, session, url)
+
+        for depth in range(max_depth + 1):
+            if not frontier:
+                break
+            results = await asyncio.gather(*(fetch(url) for url in frontier))
+            frontier = []
+
+            for result in results:
+                if result is None:
+                    continue
+                final_url, links = result
+                final_host = urlparse(normalize_url(final_url)).netloc
+                if depth == 0:
+                    # L'accueil peut rediriger vers un autre hôte (exemple.com -> www.exemple.com)
+                    host = final_host
+                elif final_host != host:
+                    continue
+
+                path = urlparse(normalize_url(final_url)).path[1:]
+                if path and len(pages) < max_pages:
+                    pages.add(path)
+
+                if depth == max_depth:
+                    continue
+                for link in links:
+                    url = normalize_url(link)
+                    parsed = urlparse(url)
+                    if (url in seen or parsed.scheme not in ("http", "https") or parsed.netloc != host
+                            or parsed.path.lower().endswith(SKIP_EXTENSIONS)):
+                        continue
+                    seen.add(url)
+                    frontier.append(url)
+
+            # Ne pas télécharger plus de pages que nécessaire
+            frontier = frontier[:max(0, max_pages - len(pages))]
+
+    return pages
+
+
+def crawl_site(base_url, max_depth=CRAWL_MAX_DEPTH, max_pages=CRAWL_MAX_PAGES,
+               concurrency=CRAWL_CONCURRENCY, stats=None):
+    """Découvre les pages en suivant les liens internes à partir de l'accueil"""
+    return asyncio.run(crawl_site_async(base_url, max_depth, max_pages, concurrency, stats))
+
+
+# ─────────────────────────────────────────────────────────────
+# PRÉ-VÉRIFICATION HTTP
+# ─────────────────────────────────────────────────────────────
+CANONICAL_RE = re.compile(
+    r"""<link\b(?=[^>]*\brel\s*=\s*["']?canonical\b)[^>]*\bhref\s*=\s*["']?([^"'\s>]+)""",
+    re.IGNORECASE
+)
+
+
+def preflight_url(session, url, cookies=None, timeout=PREFLIGHT_TIMEOUT):
+    """Vérifie une URL sans navigateur : retourne (URL canonique, None) ou (None, raison du rejet)"""
+    try:
+        with session.get(url, cookies=cookies, timeout=timeout, stream=True, allow_redirects=True) as response:
+            if response.status_code != 200:
+                return None, f"HTTP {response.status_code}"
+            content_type = response.headers.get("Content-Type", "")
+            if "text/html" not in content_type:
+                return None, f"Not HTML ({content_type.split(';')[0] or 'unknown'})"
+
+            head = b""
+            for chunk in response.iter_content(PREFLIGHT_HEAD_BYTES):
+                head += chunk
+                if len(head) >= PREFLIGHT_HEAD_BYTES or b"</head>" in head.lower():
+                    break
+            final_url = response.url
+    except requests.RequestException as e:
+        return None, f"Error: {type(e).__name__}"
+
+    match = CANONICAL_RE.search(head.decode("utf-8", "replace"))
+    if match:
+        canonical = urljoin(final_url, match.group(1))
+        if urlparse(canonical).scheme in ("http", "https"):
+            return normalize_url(canonical, keep_query=True), None
+    # La query distingue des contenus différents (product?id=1, product?id=2) : elle est gardée
+    return normalize_url(final_url, keep_query=True), None
+
+
+def preflight_pages(pages, base_url, cookies=None, workers=PREFLIGHT_WORKERS, stats=None, limit=None):
+    """Filtre les pages avant capture : redirections résolues, non-200 et non-HTML écartés,
+    doublons (même URL finale ou même rel=canonical, query comprise) supprimés.
+
+    Retourne (pages à capturer, lignes de log des pages écartées). Les pages
+    conservées pointent directement sur leur URL canonique. Avec `limit`,
+    les pages sont vérifiées par paquets et la vérification s'arrête dès
+    que `limit` pages sont conservées.
+    """
+    host = urlparse(normalize_url(base_url)).netloc
+    if cookies:
+        cookies = requests_cookies(cookie_jar(cookies, base_url))
+    chunk_size = workers * 4 if limit else max(len(pages), 1)
+
+    kept, dropped, seen = [], [], {}
+    with http_session(workers, stats) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(pages), chunk_size):
+            chunk = pages[start:start + chunk_size]
+            results = executor.map(lambda page: preflight_url(session, urljoin(base_url, page), cookies), chunk)
+            for page, (canonical, reason) in zip(chunk, results):
+                if canonical is None:
+                    dropped.append({"Page": page, "URL": urljoin(base_url, page), "Status": f"Skipped: {reason}"})
+                elif canonical in seen:
+                    dropped.append({"Page": page, "URL": urljoin(base_url, page),
+                                    "Status": f"Skipped: duplicate of {seen[canonical]}"})
+                else:
+                    parsed = urlparse(canonical)
+                    if parsed.netloc == host:
+                        target = parsed.path[1:] + (f"?{parsed.query}" if parsed.query else "")
+                    else:
+                        target = canonical
+                    seen[canonical] = target
+                    kept.append(target)
+                    if limit and len(kept) >= limit:
+                        return kept, dropped
+    return kept, dropped
+
+
+# ─────────────────────────────────────────────────────────────
+# INDEX DE CAPTURE (mode incrémental)
+# ─────────────────────────────────────────────────────────────
+class CaptureIndex:
+    """Index persistant des captures précédentes, stocké en JSON dans le dossier de sortie.
+
+    Par URL : ETag, Last-Modified, empreinte du HTML, empreinte du PNG, fichier et date.
+    """
+
+    def __init__(self, out_dir):
+        self.path = os.path.join(out_dir, CAPTURE_INDEX_FILE)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, url):
+        with self._lock:
+            return self.entries.get(url)
+
+    def update(self, url, **fields):
+        with self._lock:
+            self.entries.setdefault(url, {}).update(fields)
+
+    def save(self):
+        """Écrit l'index de façon atomique"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with self._lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+
+def file_hash(filename):
+    """Empreinte SHA-256 d'un fichier"""
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_page_changed(session, url, entry, cookies=None):
+    """Requête HTTP conditionnelle : retourne (modifiée ?, empreinte HTTP de la page)"""
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = session.get(url, headers=headers, cookies=cookies, timeout=10)
+    if response.status_code == 304 and entry:
+        return False, {}
+
+    fingerprint = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "content_hash": hashlib.sha256(response.content).hexdigest(),
+    }
+    changed = not entry or entry.get("content_hash") != fingerprint["content_hash"]
+    return changed, fingerprint
+
+
+# ─────────────────────────────────────────────────────────────
+# MANIFESTE DE REPRISE
+# ─────────────────────────────────────────────────────────────
+class CaptureManifest:
+    """Manifeste SQLite d'une exécution, stocké dans le dossier de sortie.
+
+    Chaque page y a un état (pending, in_progress, captured, failed) et sa
+    ligne de log : une exécution interrompue reprend là où elle s'est
+    arrêtée, et le tableau de résultats se reconstruit sans recapturer.
+    """
+
+    journal_mode = "WAL"
+
+    def __init__(self, out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+        self.path = os.path.join(out_dir, CAPTURE_MANIFEST_FILE)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                position INTEGER NOT NULL,
+                page TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                entry TEXT,
+                updated_at TEXT
+            )
+        """)
+        self._db.commit()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+            self._db.commit()
+            return rows
+
+    def add_pages(self, pages, base_url):
+        """Ajoute les pages inconnues à la fin du manifeste, à l'état pending"""
+        with self._lock:
+            start = self._db.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM pages").fetchone()[0]
+            self._db.executemany(
+                "INSERT OR IGNORE INTO pages (position, page, url) VALUES (?, ?, ?)",
+                [(start + i, page, urljoin(base_url, page)) for i, page in enumerate(pages)]
+            )
+            self._db.commit()
+
+    def pages(self, states=None):
+        """Pages du manifeste dans l'ordre d'origine, filtrées par état"""
+        if states is None:
+            rows = self._execute("SELECT page FROM pages ORDER BY position")
+        else:
+            marks = ",".join("?" * len(states))
+            rows = self._execute(
+                f"SELECT page FROM pages WHERE state IN ({marks}) ORDER BY position", tuple(states)
+            )
+        return [row[0] for row in rows]
+
+    def mark(self, page, state, entry=None):
+        now = datetime.now().isoformat(timespec="seconds")
+        if entry is None:
+            self._execute(
+                "UPDATE pages SET state = ?, attempts = attempts + 1, updated_at = ? WHERE page = ?",
+                (state, now, page)
+            )
+        else:
+            self._execute(
+                "UPDATE pages SET state = ?, entry = ?, updated_at = ? WHERE page = ?",
+                (state, json.dumps(entry, ensure_ascii=False), now, page)
+            )
+
+    def log(self, pages=None):
+        """Lignes de log enregistrées, dans l'ordre d'origine"""
+        rows = self._execute("SELECT page, entry FROM pages WHERE entry IS NOT NULL ORDER BY position")
+        wanted = None if pages is None else set(pages)
+        return [json.loads(entry) for page, entry in rows if wanted is None or page in wanted]
+
+    def counts(self):
+        return dict(self._execute("SELECT state, COUNT(*) FROM pages GROUP BY state"))
+
+    def reset(self):
+        self._execute("DELETE FROM pages")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# ─────────────────────────────────────────────────────────────
+# PIPELINE
+# ─────────────────────────────────────────────────────────────
+def discover_site_pages(base_url, max_depth=CRAWL_MAX_DEPTH, max_pages=CRAWL_MAX_PAGES, timings=None):
+    """Découvre automatiquement les pages du site.
+
+    Si `timings` est un dict, il reçoit la durée de chaque méthode et le
+    nombre / temps cumulé des requêtes HTTP.
+    """
+    if timings is None:
+        timings = {}
+
+    start = time.perf_counter()
+    try:
+        # Essayer via robots.txt / sitemaps (index, gzip)
+        sitemap_pages = discover_sitemap_pages(base_url, stats=timings)
+        if sitemap_pages:
+            return sorted(sitemap_pages)
+    except:
+        pass
+    finally:
+        timings["sitemaps_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    # Fallback: crawler le site à partir de la page d'accueil
+    start = time.perf_counter()
+    try:
+        return sorted(crawl_site(base_url, max_depth, max_pages, stats=timings))
+    except:
+        return []
+    finally:
+        timings["crawl_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+
+def page_filename(out_dir, page, width=None, extension="png"):
+    """Chemin de la capture d'une page (suffixé par la largeur en mode multi-viewport)"""
+    # La query fait partie de la page (product?id=1) : ses caractères interdits sont remplacés
+    name = re.sub(r'[\\/:*?"<>|]', "_", page) or "index"
+    if width is not None:
+        name = f"{name}_{width}"
+    return f"{out_dir}/{name}.{extension}"
+
+
+def page_files(out_dir, page, viewports=None, full_page=False, output=None):
+    """Fichiers de capture d'une page, par largeur ({None: ...} sans viewports)"""
+    if full_page and output is not None and output.format != "PNG":
+        output = None
+    extension = FORMAT_EXTENSIONS[output.format] if output else "png"
+    return {width: page_filename(out_dir, page, width, extension) for width in viewports or [None]}
+
+
+def viewport_size(width):
+    """Taille de fenêtre pour une largeur (hauteur usuelle si connue)"""
+    return width, VIEWPORT_HEIGHTS.get(width, WINDOW_SIZE[1])
+
+
+def capture_page(page, base_url, pool, authenticated=False, out_dir="captures", cookies=None,
+                 consent_memory=None, index=None, session=None, block=None, viewports=None,
+                 full_page=False, output=None, policy=None, breaker=None):
+    """Capture une seule page et retourne sa ligne de log, avec la durée de chaque phase.
+
+    Avec un `index` (mode incrémental), une requête HTTP conditionnelle est
+    faite d'abord et le PNG précédent est conservé si la page n'a pas changé.
+    Avec un profil `block`, la ligne indique aussi les requêtes bloquées et
+    le volume transféré.
+
+    En mode `authenticated`, les `cookies` (dict ou liste complète, voir
+    cookie_jar) sont posés par CDP avant l'unique navigation.
+
+    Avec une liste de `viewports` (largeurs), la page est chargée une seule
+    fois puis redimensionnée et capturée à chaque largeur (`page_1920.png`,
+    `page_768.png`...). Avec `full_page`, toute la hauteur est capturée par
+    tuiles, écrites directement sur disque (toujours en PNG).
+
+    `output` (voir OUTPUT_FORMATS) réencode la capture une fois le navigateur
+    rendu au pool ; la ligne de log compare taille brute et taille finale.
+
+    `policy` (ResiliencePolicy) fixe le délai de chargement et le nombre de
+    nouvelles tentatives sur erreur transitoire, chacune sur un navigateur
+    neuf ; `breaker` (CircuitBreaker partagé par l'exécution) met en pause
+    ou abandonne un hôte qui enchaîne les échecs.
+    """
+    if policy is None:
+        policy = ResiliencePolicy()
+    url = urljoin(base_url, page)
+    jar = cookie_jar(cookies, base_url) if authenticated else []
+    if full_page and output is not None and output.format != "PNG":
+        output = None
+    filenames = page_files(out_dir, page, viewports, full_page, output)
+    timer = PhaseTimer()
+    resources = {}
+    sizes = {}
+    driver = None
+    attempts = 0
+
+    def row(status):
+        return {
+            "Page": page,
+            "URL": url,
+            "Status": status,
+            "Time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "Attempts": attempts,
+            **({"Viewports": ",".join(map(str, viewports))} if viewports else {}),
+            **timer.columns(),
+            **resources,
+            **sizes
+        }
+
+    def attempt_capture():
+        nonlocal driver, resources, sizes
+        fingerprint = {}
+        if index is not None:
+            entry = index.get(url)
+            if entry and not all(os.path.exists(filename) for filename in filenames.values()):
+                entry = None
+            with timer.phase("http"):
+                changed, fingerprint = check_page_changed(
+                    session, url, entry, requests_cookies(jar) if jar else None
+                )
+            if not changed:
+                index.update(url, checked_at=datetime.now().isoformat(timespec="seconds"))
+                return row("Unchanged")
+
+        with timer.phase("driver"):
+            driver = pool.acquire(block=block)
+            driver.set_page_load_timeout(policy.page_load_timeout)
+            if block:
+                driver.get_log("performance")  # Vider le journal de la page précédente
+            if viewports:
+                driver.set_window_size(*viewport_size(viewports[0]))
+
+        if jar:
+            with timer.phase("cookies"):
+                inject_cookies(driver, jar, url)
+
+        with timer.phase("navigation"):
+            driver.get(url)
+        with timer.phase("settle"):
+            settle_page(driver)
+
+        # Essayer d'accepter les cookies
+        with timer.phase("consent"):
+            dismiss_consent(driver, url, {} if consent_memory is None else consent_memory)
+
+        if block:
+            resources = resource_stats(driver)
+
+        # Screenshot (une par largeur, sans recharger la page)
+        pngs = {}
+        for i, width in enumerate(filenames):
+            if i > 0:
+                with timer.phase("settle"):
+                    driver.set_window_size(*viewport_size(width))
+                    settle_page(driver, max_wait=VIEWPORT_SETTLE_MAX_WAIT)
+            with timer.phase("screenshot"):
+                if full_page:
+                    os.makedirs(out_dir, exist_ok=True)
+                    capture_full_page(driver, filenames[width])
+                else:
+                    pngs[width] = driver.get_screenshot_as_png()
+
+        pool.release(driver)
+        driver = None
+
+        # Encodage hors navigateur : il est déjà disponible pour une autre page
+        if pngs:
+            with timer.phase("encode"):
+                encoded = {width: encode_screenshot(png, output) for width, png in pngs.items()}
+            sizes = {
+                "raw (KB)": round(sum(map(len, pngs.values())) / 1024, 1),
+                "output (KB)": round(sum(map(len, encoded.values())) / 1024, 1),
+            }
+            pngs = None
+
+            with timer.phase("write"):
+                os.makedirs(out_dir, exist_ok=True)
+                for width, data in encoded.items():
+                    with open(filenames[width], "wb") as f:
+                        f.write(data)
+
+        if index is not None:
+            now = datetime.now().isoformat(timespec="seconds")
+            index.update(url, files=list(filenames.values()),
+                         screenshot_hash=[file_hash(filename) for filename in filenames.values()],
+                         captured_at=now, checked_at=now, **fingerprint)
+        return row("Captured")
+
+    host = urlparse(url).netloc
+    for attempt in range(policy.retries + 1):
+        attempts = attempt + 1
+        try:
+            if breaker is not None:
+                breaker.before(host)
+            result = attempt_capture()
+            if breaker is not None:
+                breaker.success(host)
+            return result
+        except CircuitOpenError as e:
+            return row(f"Error: {e}")
+        except Exception as e:
+            transient = is_transient_error(e)
+            if driver is not None:
+                # Après un délai dépassé, le navigateur peut rester bloqué bien que vivant :
+                # il est toujours fermé, la tentative suivante part d'un navigateur neuf
+                pool.release(driver, failed=True, recycle=transient)
+                driver = None
+            if attempt < policy.retries and transient:
+                time.sleep(min(policy.backoff * 2 ** attempt, policy.backoff_max))
+                continue
+            if breaker is not None and transient:
+                # Un échec par page, et seulement s'il vient du site (délai, réseau) :
+                # une erreur locale (encodage, disque) ne coupe pas l'hôte
+                breaker.failure(host)
+            return row(f"Error: {error_message(e)}")
+
+
+def available_memory():
+    """Mémoire utilisable (octets), ou None si inconnue.
+
+    MemAvailable compte le cache de pages récupérable ; MemFree
+    (SC_AVPHYS_PAGES), bien plus bas sur un serveur, ne sert que de repli.
+    """
+    try:
+        with open("/proc/meminfo", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def max_capture_workers(requested=None):
+    """Nombre de navigateurs simultanés supportable par la machine (CPU et RAM)"""
+    limit = os.cpu_count() or 1
+    available = available_memory()
+    if available is not None:
+        limit = min(limit, available // (BROWSER_RAM_MB * 1024 * 1024))
+    if requested is not None:
+        limit = min(limit, requested)
+    return max(1, int(limit))
+
+
+def capture_screens(pages, base_url, authenticated=False, out_dir="captures", cookies=None, log=None,
+                    pool=None, workers=1, on_result=None, consent_memory=None,
+                    incremental=False, manifest=None, retry_failed=False, cancel_event=None,
+                    block=None, viewports=None, full_page=False, output=None, policy=None, archive=None,
+                    breaker=None):
+    """Capture les pages web, éventuellement avec plusieurs navigateurs en parallèle.
+
+    Les lignes de log sont ajoutées dans l'ordre de `pages`, quel que soit
+    l'ordre de fin des captures. En mode `incremental`, seules les pages
+    modifiées depuis le dernier passage sont recapturées.
+
+    Avec un `manifest`, les pages déjà capturées lors d'une exécution
+    précédente sont sautées (et les pages en échec aussi, sauf avec
+    `retry_failed`) ; leurs lignes de log sont reprises du manifeste.
+
+    Si `cancel_event` est levé, les pages pas encore commencées sont
+    abandonnées (elles restent `pending` dans le manifeste).
+
+    `policy` (ResiliencePolicy) règle délais, nouvelles tentatives et
+    coupe-circuit par hôte pour toute l'exécution. Un `breaker`
+    (CircuitBreaker) fourni est partagé au-delà de cet appel.
+
+    Avec une `archive` (CaptureArchive), chaque capture y est ajoutée dès
+    qu'elle est écrite ; le rapport est ajouté par `archive.finish`.
+    """
+    if log is None:
+        log = []
+    own_pool = pool is None
+    if own_pool:
+        pool = DriverPool()
+    if consent_memory is None:
+        consent_memory = {}
+    if authenticated:
+        cookies = cookie_jar(cookies, base_url)
+
+    def archive_page(page):
+        for filename in page_files(out_dir, page, viewports, full_page, output).values():
+            if os.path.exists(filename):
+                archive.add(filename)
+
+    all_pages = pages
+    if manifest is not None:
+        manifest.add_pages(pages, base_url)
+        todo = set(manifest.pages(["pending", "in_progress", "failed"] if retry_failed
+                                  else ["pending", "in_progress"]))
+        pages = [page for page in pages if page in todo]
+        if archive is not None:
+            for page in manifest.pages(["captured"]):
+                archive_page(page)
+
+    workers = max_capture_workers(workers)
+    results = [None] * len(pages)
+    index = CaptureIndex(out_dir) if incremental else None
+    session = http_session(workers) if incremental else None
+    if breaker is None:
+        breaker = CircuitBreaker.from_policy(policy or ResiliencePolicy())
+
+    def capture(page):
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        if manifest is not None:
+            manifest.mark(page, "in_progress")
+        entry = capture_page(page, base_url, pool, authenticated=authenticated, out_dir=out_dir,
+                             cookies=cookies, consent_memory=consent_memory,
+                             index=index, session=session, block=block, viewports=viewports,
+                             full_page=full_page, output=output, policy=policy, breaker=breaker)
+        if manifest is not None:
+            state = "failed" if entry["Status"].startswith("Error") else "captured"
+            manifest.mark(page, state, entry)
+        if archive is not None and not entry["Status"].startswith("Error"):
+            archive_page(page)
+        return entry
+
+    try:
+        if workers <= 1:
+            for i, page in enumerate(pages):
+                results[i] = capture(page)
+                if results[i] is None:
+                    break
+                if on_result:
+                    on_result(results[i], i + 1, len(pages))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(capture, page): i for i, page in enumerate(pages)}
+                for done, future in enumerate(as_completed(futures), start=1):
+                    i = futures[future]
+                    results[i] = future.result()
+                    if on_result and results[i] is not None:
+                        on_result(results[i], done, len(pages))
+    finally:
+        if index is not None:
+            index.save()
+            session.close()
+        if own_pool:
+            pool.close()
+
+    if manifest is not None:
+        log.extend(manifest.log(all_pages))
+    else:
+        log.extend(entry for entry in results if entry is not None)
+    return log
+
+
+# ─────────────────────────────────────────────────────────────
+# EXPORT ZIP
+# ─────────────────────────────────────────────────────────────
+class CaptureArchive:
+    """Archive ZIP d'une exécution, écrite sur disque au fil des captures.
+
+    Les images sont stockées sans recompression (ZIP_STORED : PNG, WebP et
+    JPEG sont déjà compressés) et copiées par blocs depuis leur fichier ;
+    l'archive n'est jamais en mémoire. Elle est écrite dans `path + ".part"`
+    puis renommée par `finish`, qui ajoute le rapport à la fin.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._names = set()
+        self._zip = zipfile.ZipFile(path + ".part", "w", zipfile.ZIP_STORED, allowZip64=True)
+
+    def add(self, filename, arcname=None):
+        """Ajoute un fichier (une seule fois par nom)"""
+        arcname = arcname or os.path.basename(filename)
+        with self._lock:
+            if arcname in self._names:
+                return
+            self._names.add(arcname)
+            self._zip.write(filename, arcname)
+
+    def finish(self, log, report=None):
+        """Ajoute le log (Excel + CSV) et le rapport de temps, puis ferme l'archive"""
+        df = pd.DataFrame(log)
+        excel = BytesIO()
+        df.to_excel(excel, index=False)
+        with self._lock:
+            self._zip.writestr("log_captures.xlsx", excel.getvalue(), zipfile.ZIP_DEFLATED)
+            self._zip.writestr("log_captures.csv", df.to_csv(index=False), zipfile.ZIP_DEFLATED)
+            if report is not None:
+                self._zip.writestr("timing_report.json", json.dumps(report, ensure_ascii=False, indent=2),
+                                   zipfile.ZIP_DEFLATED)
+            self._zip.close()
+        os.replace(self.path + ".part", self.path)
+        return self.path
+
+    def abort(self):
+        """Ferme l'archive inachevée sans la publier"""
+        with self._lock:
+            self._zip.close()
+
+
+# ─────────────────────────────────────────────────────────────
+# TÂCHES EN ARRIÈRE-PLAN
+# ─────────────────────────────────────────────────────────────
+class CaptureJob:
+    """Découverte + captures exécutées dans un thread, suivies par identifiant.
+
+    Le registre des tâches vit dans ce module : une page Streamlit peut se
+    réexécuter (ou l'onglet être rechargé) sans interrompre la tâche, puis
+    s'y rattacher avec `get_job`.
+    """
+
+    def __init__(self, base_url, target, out_dir="captures"):
+        self.id = uuid.uuid4().hex[:8]
+        self.base_url = base_url
+        self.out_dir = out_dir  # Une seule tâche active par dossier (manifeste, index, archive)
+        self.status = "pending"  # pending, running, done, cancelled, failed
+        self.phase = None  # discovery, capture
+        self.done = 0
+        self.total = 0
+        self.error = None
+        self.discovery_timings = {}
+        self.report = None
+        self.skipped = []  # Pages écartées par la pré-vérification
+        self.archive_path = None  # ZIP des captures et du rapport (export_zip)
+        self.created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.finished_at = None  # time.monotonic() de la fin de la tâche
+        self.cancel_event = threading.Event()
+        self._log = []
+        self._lock = threading.Lock()
+        self._target = target
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        self.status = "running"
+        try:
+            log = self._target(self)
+            with self._lock:
+                self._log = log
+            self.status = "cancelled" if self.cancel_event.is_set() else "done"
+        except Exception as e:
+            self.error = str(e)
+            self.status = "failed"
+        finally:
+            # La fermeture retient pool, manifeste et options : libérée dès la fin
+            self._target = None
+            self.finished_at = time.monotonic()
+
+    def on_result(self, entry, done, total):
+        """Callback de `capture_screens` : enregistre un résultat partiel"""
+        with self._lock:
+            self._log.append(entry)
+            self.done = done
+            self.total = total
+
+    def log(self):
+        """Copie des lignes de log disponibles (dans l'ordre des pages une fois terminée)"""
+        with self._lock:
+            return list(self._log)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def running(self):
+        return self.status in ("pending", "running")
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def _prune_jobs(ttl=JOBS_TTL, max_finished=JOBS_MAX_FINISHED):
+    """Oublie les tâches terminées depuis plus de `ttl`, et au-delà des `max_finished` plus récentes.
+
+    À appeler avec `_jobs_lock`.
+    """
+    now = time.monotonic()
+    finished = sorted((job for job in _jobs.values() if job.finished_at is not None),
+                      key=lambda job: job.finished_at, reverse=True)
+    for i, job in enumerate(finished):
+        if i >= max_finished or now - job.finished_at > ttl:
+            del _jobs[job.id]
+
+
+def running_job(out_dir):
+    """Tâche en cours écrivant dans `out_dir`, ou None"""
+    with _jobs_lock:
+        return next((job for job in _jobs.values() if job.running and job.out_dir == out_dir), None)
+
+
+def submit_capture_job(base_url, pages=None, limit=None, discover_options=None, preflight=False,
+                       export_zip=False, reset_manifest=False, **capture_kwargs):
+    """Lance découverte (si `pages` est None), pré-vérification et captures dans un thread.
+
+    Avec `export_zip`, les captures sont ajoutées au fil de l'eau à une
+    archive du dossier de sortie (`job.archive_path` une fois terminée).
+    `reset_manifest` vide le manifeste avant de commencer (nouvelle exécution).
+
+    Lève RuntimeError si une autre tâche écrit déjà dans le même dossier :
+    manifeste, index et archive y sont partagés.
+    """
+    out_dir = capture_kwargs.get("out_dir", "captures")
+
+    def target(job):
+        if reset_manifest and capture_kwargs.get("manifest") is not None:
+            capture_kwargs["manifest"].reset()
+        todo = pages
+        if todo is None:
+            job.phase = "discovery"
+            todo = discover_site_pages(base_url, timings=job.discovery_timings, **(discover_options or {}))
+        if preflight:
+            job.phase = "preflight"
+            cookies = capture_kwargs.get("cookies") if capture_kwargs.get("authenticated") else None
+            todo, job.skipped = preflight_pages(todo, base_url, cookies, stats=job.discovery_timings,
+                                                limit=limit)
+        if limit:
+            todo = todo[:limit]
+        job.phase = "capture"
+        job.total = len(todo)
+        archive = CaptureArchive(os.path.join(out_dir, CAPTURE_ARCHIVE_FILE)) if export_zip else None
+        try:
+            log = capture_screens(todo, base_url, on_result=job.on_result,
+                                  cancel_event=job.cancel_event, archive=archive, **capture_kwargs)
+        except BaseException:
+            if archive is not None:
+                archive.abort()
+            raise
+        job.report = write_timing_report(log, out_dir, job.discovery_timings)
+        if archive is not None:
+            job.archive_path = archive.finish(log, job.report)
+        return log
+
+    job = CaptureJob(base_url, target, out_dir)
+    with _jobs_lock:
+        # Vérification et enregistrement sous le même verrou : deux sessions ne
+        # peuvent pas lancer chacune une tâche dans le même dossier
+        if any(other.running and other.out_dir == out_dir for other in _jobs.values()):
+            raise RuntimeError(f"une tâche de capture écrit déjà dans {out_dir}")
+        _prune_jobs()
+        _jobs[job.id] = job
+    job._thread.start()
+    return job
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def list_jobs():
+    """Tâches connues, les plus récentes d'abord"""
+    with _jobs_lock:
+        _prune_jobs()
+        return sorted(_jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+
+# ─────────────────────────────────────────────────────────────
+# FILE DE CAPTURE DISTRIBUÉE
+# ─────────────────────────────────────────────────────────────
+def capture_options(viewports=None, full_page=False, format="png", block="aucun", policy=None):
+    """Options de capture sérialisables (JSON), partagées par les workers d'une file"""
+    return {"viewports": viewports, "full_page": full_page, "format": format, "block": block,
+            "policy": (policy or ResiliencePolicy())._asdict()}
+
+
+def capture_kwargs(options):
+    """Options sérialisées -> arguments de capture_screens"""
+    return {
+        "viewports": options.get("viewports"),
+        "full_page": options.get("full_page", False),
+        "output": OUTPUT_FORMATS[options.get("format", "png")],
+        "block": BLOCK_PROFILES[options.get("block", "aucun")],
+        "policy": ResiliencePolicy(**options.get("policy", {})),
+    }
+
+
+class CaptureQueue(CaptureManifest):
+    """File de pages partagée par plusieurs workers (processus ou machines).
+
+    C'est le manifeste du dossier de sortie, complété par un bail par page :
+    un worker réserve des pages (`claim`), renouvelle son bail tant qu'il
+    tourne (`renew`) et rend chaque résultat (`complete`). Les pages d'un
+    worker planté redeviennent disponibles à l'expiration du bail.
+
+    Sur un volume partagé, le système de fichiers doit gérer les verrous
+    POSIX ; le journal SQLite n'est pas en WAL, qui exige une mémoire
+    partagée sur un seul hôte.
+    """
+
+    journal_mode = "DELETE"
+
+    def __init__(self, out_dir):
+        super().__init__(out_dir)
+        with self._lock:
+            self._db.execute("PRAGMA busy_timeout = 30000")
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(pages)")}
+            if "lease_owner" not in columns:
+                self._db.execute("ALTER TABLE pages ADD COLUMN lease_owner TEXT")
+                self._db.execute("ALTER TABLE pages ADD COLUMN lease_until REAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._db.commit()
+
+    def publish(self, pages, base_url, options=None):
+        """Place les pages dans la file avec le site et les options de capture"""
+        self.add_pages(pages, base_url)
+        self._execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                      ("run", json.dumps({"base_url": base_url, "options": options or capture_options()})))
+
+    def meta(self):
+        """(base_url, options) publiés, ou (None, {}) si la file est vide"""
+        rows = self._execute("SELECT value FROM meta WHERE key = 'run'")
+        if not rows:
+            return None, {}
+        run = json.loads(rows[0][0])
+        return run["base_url"], run["options"]
+
+    def claim(self, worker, count=1, lease=QUEUE_LEASE, max_claims=QUEUE_MAX_CLAIMS):
+        """Réserve jusqu'à `count` pages (en attente ou au bail expiré) pour `worker`"""
+        now = time.time()
+        stamp = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            # IMMEDIATE : deux workers ne peuvent pas réserver la même page
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                abandoned = self._db.execute(
+                    "SELECT page, url, attempts FROM pages WHERE state = 'in_progress' "
+                    "AND COALESCE(lease_until, 0) < ? AND attempts >= ?", (now, max_claims)
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE pages SET state = 'failed', entry = ?, lease_owner = NULL, updated_at = ? WHERE page = ?",
+                    [(json.dumps({"Page": page, "URL": url, "Status": f"Error: bail expiré {attempts} fois",
+                                  "Time": stamp.replace("T", " "), "Attempts": attempts}, ensure_ascii=False), stamp, page)
+                     for page, url, attempts in abandoned]
+                )
+                pages = [row[0] for row in self._db.execute(
+                    "SELECT page FROM pages WHERE state = 'pending' "
+                    "OR (state = 'in_progress' AND COALESCE(lease_until, 0) < ?) ORDER BY position LIMIT ?",
+                    (now, count)
+                )]
+                self._db.executemany(
+                    "UPDATE pages SET state = 'in_progress', lease_owner = ?, lease_until = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE page = ?",
+                    [(worker, now + lease, stamp, page) for page in pages]
+                )
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return pages
+
+    def renew(self, worker, pages, lease=QUEUE_LEASE):
+        """Prolonge le bail des pages encore détenues par `worker`"""
+        if not pages:
+            return
+        with self._lock:
+            self._db.executemany(
+                "UPDATE pages SET lease_until = ? WHERE page = ? AND lease_owner = ? AND state = 'in_progress'",
+                [(time.time() + lease, page, worker) for page in pages]
+            )
+            self._db.commit()
+
+    def complete(self, worker, entry):
+        """Enregistre le résultat d'une page ; ignoré si le bail a été repris par un autre worker"""
+        state = "failed" if entry["Status"].startswith("Error") else "captured"
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE pages SET state = ?, entry = ?, lease_owner = NULL, updated_at = ? "
+                "WHERE page = ? AND lease_owner = ?",
+                (state, json.dumps(entry, ensure_ascii=False), datetime.now().isoformat(timespec="seconds"),
+                 entry["Page"], worker)
+            )
+            self._db.commit()
+        return cursor.rowcount > 0
+
+    def release(self, worker, pages):
+        """Remet en attente les pages réservées mais pas capturées (arrêt du worker)"""
+        with self._lock:
+            self._db.executemany(
+                "UPDATE pages SET state = 'pending', lease_owner = NULL, lease_until = NULL, "
+                "attempts = MAX(attempts - 1, 0) WHERE page = ? AND lease_owner = ? AND state = 'in_progress'",
+                [(page, worker) for page in pages]
+            )
+            self._db.commit()
+
+    def reset(self):
+        with self._lock:
+            self._db.execute("DELETE FROM pages")
+            self._db.execute("DELETE FROM meta")
+            self._db.commit()
+
+
+def run_worker(out_dir, worker_id=None, workers=1, cookies=None, lease=QUEUE_LEASE, poll=QUEUE_POLL,
+               on_result=None, stop_event=None):
+    """Worker de capture : prend des pages dans la file de `out_dir` jusqu'à ce qu'elle soit vide.
+
+    Autant de workers que voulu peuvent tourner en même temps, sur une ou
+    plusieurs machines partageant le dossier. Chacun capture ses pages avec
+    `workers` navigateurs, chacun réservant une nouvelle page dès que la
+    précédente est finie, et écrit captures et lignes de log dans le
+    dossier. Retourne les lignes de log de ce worker.
+    """
+    queue = CaptureQueue(out_dir)
+    base_url, options = queue.meta()
+    if base_url is None:
+        queue.close()
+        raise ValueError(f"aucune file de capture publiée dans {out_dir}")
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    workers = max_capture_workers(workers)
+    total = len(queue.pages())
+    kwargs = capture_kwargs(options)
+    pool = DriverPool()
+    # Partagés par toutes les pages du worker, comme dans une exécution capture_screens
+    consent_memory = {}
+    breaker = CircuitBreaker.from_policy(kwargs["policy"])
+    held = set()
+    held_lock = threading.Lock()
+    stopped = threading.Event()
+    log = []
+
+    def heartbeat():
+        while not stopped.wait(lease / 3):
+            with held_lock:
+                pages = list(held)
+            queue.renew(worker_id, pages, lease)
+
+    def running():
+        return not stopped.is_set() and (stop_event is None or not stop_event.is_set())
+
+    def done(entry, _done, _total):
+        queue.complete(worker_id, entry)
+        with held_lock:
+            held.discard(entry["Page"])
+            log.append(entry)
+            count = len(log)
+        if on_result:
+            on_result(entry, count, total)
+
+    def slot():
+        """Un navigateur : réserve une page, la capture, recommence"""
+        while running():
+            pages = queue.claim(worker_id, 1, lease)
+            if not pages:
+                if not queue.pages(["pending", "in_progress"]):
+                    return
+                time.sleep(poll)  # Pages réservées ailleurs : attendre leur fin ou l'expiration du bail
+                continue
+            with held_lock:
+                held.update(pages)
+            capture_screens(pages, base_url, authenticated=bool(cookies), out_dir=out_dir, cookies=cookies,
+                            pool=pool, on_result=done, cancel_event=stop_event,
+                            consent_memory=consent_memory, breaker=breaker, **kwargs)
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(slot) for _ in range(workers)]
+            try:
+                for future in futures:
+                    future.result()
+            finally:
+                stopped.set()  # Une erreur arrête les autres navigateurs après leur page en cours
+    finally:
+        stopped.set()
+        with held_lock:
+            queue.release(worker_id, list(held))
+        pool.close()
+        queue.close()
+    return log
+
+
+# ─────────────────────────────────────────────────────────────
+# LIGNE DE COMMANDE
+# ─────────────────────────────────────────────────────────────
+def load_cookies(path):
+    """Charge un fichier JSON de cookies : {nom: valeur}, liste exportée par Selenium
+    ou session enregistrée par save_session (attributs conservés)"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict) and isinstance(data.get("cookies"), list):
+        return cookie_jar(data["cookies"])
+    if isinstance(data, list):
+        return cookie_jar(data)
+    return data
+
+
+def read_url_list(path):
+    """Lit un fichier d'URLs (une par ligne, `#` pour les commentaires)"""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def pages_from_urls(urls):
+    """Retourne (base_url, pages) : chemins relatifs pour l'hôte de la première URL"""
+    base = urlparse(urls[0])
+    base_url = f"{base.scheme}://{base.netloc}/"
+    pages = []
+    for url in urls:
+        parsed = urlparse(url)
+        if parsed.netloc == base.netloc:
+            pages.append(parsed.path.lstrip("/") + (f"?{parsed.query}" if parsed.query else ""))
+        else:
+            pages.append(url)
+    return base_url, pages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Captures d'écran automatiques de pages web")
+    parser.add_argument("site", nargs="?", help="URL du site à découvrir puis capturer")
+    parser.add_argument("--urls", help="fichier d'URLs à capturer, une par ligne (pas de découverte)")
+    parser.add_argument("--out", default="captures", help="dossier de sortie (défaut : captures)")
+    parser.add_argument("--workers", type=int, default=4, help="navigateurs en parallèle")
+    parser.add_argument("--cookies", help="fichier JSON de cookies pour les captures authentifiées")
+    parser.add_argument("--session", action="store_true",
+                        help=f"réutiliser la session enregistrée du site ({SESSIONS_DIR}/<hôte>.json)")
+    parser.add_argument("--max-pages", type=int, help="limite le nombre de pages capturées")
+    parser.add_argument("--depth", type=int, default=CRAWL_MAX_DEPTH, help="profondeur du crawler sans sitemap")
+    parser.add_argument("--preflight", action="store_true",
+                        help="écarter 404, redirections en double, non-HTML et doublons canoniques avant capture")
+    parser.add_argument("--incremental", action="store_true", help="ne recapturer que les pages modifiées")
+    parser.add_argument("--viewports", help="largeurs à capturer, ex. 1920,768,375 (une seule navigation)")
+    parser.add_argument("--full-page", action="store_true", help="capturer toute la hauteur des pages")
+    parser.add_argument("--format", choices=list(OUTPUT_FORMATS), default="png",
+                        help="format des captures (png, webp, jpeg, miniature...)")
+    parser.add_argument("--block", choices=list(BLOCK_PROFILES), default="aucun",
+                        help="profil de blocage des ressources (images, polices, traceurs...)")
+    parser.add_argument("--timeout", type=float, default=PAGE_LOAD_TIMEOUT,
+                        help="délai maximal de chargement d'une page en secondes")
+    parser.add_argument("--retries", type=int, default=ResiliencePolicy().retries,
+                        help="nouvelles tentatives sur erreur transitoire (délai, réseau, plantage)")
+    parser.add_argument("--breaker-threshold", type=int, default=ResiliencePolicy().breaker_threshold,
+                        help="pages consécutives en échec (erreur transitoire) avant de couper un hôte")
+    parser.add_argument("--abort-on-breaker", action="store_true",
+                        help="abandonner les pages d'un hôte coupé au lieu de faire une pause")
+    parser.add_argument("--resume", action="store_true", help="reprendre l'exécution interrompue du dossier")
+    parser.add_argument("--retry-failed", action="store_true", help="réessayer les pages en échec")
+    parser.add_argument("--zip", action="store_true",
+                        help=f"écrire aussi les captures et le rapport dans {CAPTURE_ARCHIVE_FILE}, au fil de l'eau")
+    parser.add_argument("--enqueue", action="store_true",
+                        help="publier les pages dans la file du dossier --out pour des workers, sans capturer")
+    parser.add_argument("--worker", action="store_true",
+                        help="capturer les pages de la file du dossier --out (plusieurs workers possibles)")
+    parser.add_argument("--lease", type=float, default=QUEUE_LEASE,
+                        help="bail d'une page réservée par un worker en secondes")
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        return run_worker_cli(args, parser)
+    if not args.site and not args.urls:
+        parser.error("indiquez une URL de site ou --urls")
+
+    manifest = CaptureManifest(args.out)
+    discovery_timings = {}
+    if args.urls:
+        base_url, pages = pages_from_urls(read_url_list(args.urls))
+    else:
+        base_url = args.site
+
+    if (args.resume or args.retry_failed) and manifest.pages():
+        pages = manifest.pages()
+    else:
+        manifest.reset()
+        if not args.urls:
+            print(f"Découverte des pages de {base_url}...", file=sys.stderr)
+            pages = discover_site_pages(base_url, max_depth=args.depth, timings=discovery_timings)
+    cookies = load_cookies(args.cookies) if args.cookies else None
+    if args.session:
+        cookies = load_session(session_path(base_url))
+        if cookies is None:
+            parser.error(f"aucune session valide dans {session_path(base_url)}")
+    if args.preflight:
+        pages, skipped = preflight_pages(pages, base_url, cookies, stats=discovery_timings,
+                                         limit=args.max_pages)
+        print(f"Pré-vérification : {len(pages)} pages conservées, {len(skipped)} écartées", file=sys.stderr)
+        with open(os.path.join(args.out, "preflight_skipped.jsonl"), "w", encoding="utf-8") as f:
+            for entry in skipped:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    if args.max_pages:
+        pages = pages[:args.max_pages]
+
+    viewports = [int(width) for width in args.viewports.split(",")] if args.viewports else None
+    policy = ResiliencePolicy(page_load_timeout=args.timeout, retries=args.retries,
+                              breaker_threshold=args.breaker_threshold, breaker_abort=args.abort_on_breaker)
+    options = capture_options(viewports, args.full_page, args.format, args.block, policy)
+
+    if args.enqueue:
+        manifest.close()
+        queue = CaptureQueue(args.out)
+        queue.publish(pages, base_url, options)
+        print(f"{len(pages)} pages publiées dans {queue.path}", file=sys.stderr)
+        queue.close()
+        return 0
+
+    warn_worker_limit(args.workers)
+    archive = CaptureArchive(os.path.join(args.out, CAPTURE_ARCHIVE_FILE)) if args.zip else None
+    try:
+        with open(os.path.join(args.out, "run_log.jsonl"), "a", encoding="utf-8") as log_file:
+            log = capture_screens(pages, base_url, authenticated=bool(cookies), out_dir=args.out,
+                                  cookies=cookies, workers=args.workers, on_result=cli_logger(log_file),
+                                  incremental=args.incremental, manifest=manifest,
+                                  retry_failed=args.retry_failed, archive=archive, **capture_kwargs(options))
+    except BaseException:
+        if archive is not None:
+            archive.abort()
+        raise
+
+    report = write_timing_report(log, args.out, discovery_timings)
+    if archive is not None:
+        print(f"Archive : {archive.finish(log, report)}", file=sys.stderr)
+    return print_summary(log, args.out, report)
+
+
+def cli_logger(log_file):
+    """Callback on_result de la ligne de commande : run_log.jsonl + progression sur stderr"""
+
+    def on_result(entry, done, total):
+        log_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        log_file.flush()
+        print(f"[{done}/{total}] {entry['Status']}: {entry['Page']}", file=sys.stderr)
+
+    return on_result
+
+
+def run_worker_cli(args, parser):
+    """`--worker` : vide la file du dossier, puis écrit le rapport si elle est terminée"""
+    queue = CaptureQueue(args.out)
+    base_url, _ = queue.meta()
+    queue.close()
+    if base_url is None:
+        parser.error(f"aucune file de capture publiée dans {args.out} (voir --enqueue)")
+    cookies = load_cookies(args.cookies) if args.cookies else None
+    if args.session:
+        cookies = load_session(session_path(base_url))
+        if cookies is None:
+            parser.error(f"aucune session valide dans {session_path(base_url)}")
+
+    warn_worker_limit(args.workers)
+    with open(os.path.join(args.out, "run_log.jsonl"), "a", encoding="utf-8") as log_file:
+        log = run_worker(args.out, workers=args.workers, cookies=cookies, lease=args.lease,
+                         on_result=cli_logger(log_file))
+
+    queue = CaptureQueue(args.out)
+    remaining = queue.pages(["pending", "in_progress"])
+    full_log = queue.log()
+    queue.close()
+    if remaining:
+        print(f"{len(remaining)} pages encore en cours chez d'autres workers", file=sys.stderr)
+    else:
+        print_summary(full_log, args.out, write_timing_report(full_log, args.out, {}))
+    return 1 if any(entry["Status"].startswith("Error") for entry in log) else 0
+
+
+def warn_worker_limit(requested):
+    """Signale sur stderr quand la machine ne permet pas `requested` navigateurs"""
+    workers = max_capture_workers(requested)
+    if workers < requested:
+        print(f"{requested} navigateurs demandés, {workers} utilisés (CPU et mémoire disponible)",
+              file=sys.stderr)
+
+
+def print_summary(log, out_dir, report):
+    """Affiche le rapport de temps sur stderr et retourne le code de sortie"""
+    for phase, stats in report["phases"].items():
+        print(f"  {phase:<11} p50={stats['p50']} ms  p95={stats['p95']} ms", file=sys.stderr)
+    if "output" in report:
+        print(f"  {report['output']['raw_kb']} Ko bruts -> {report['output']['output_kb']} Ko écrits",
+              file=sys.stderr)
+    if "resources" in report:
+        print(f"  {report['resources']['blocked_requests']} requêtes bloquées, "
+              f"{report['resources']['transferred_kb']} Ko transférés", file=sys.stderr)
+
+    failed = [entry for entry in log if entry["Status"].startswith("Error")]
+    print(f"{len(log) - len(failed)} pages capturées, {len(failed)} en échec -> {out_dir}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+Moteur de recadrage par lot, utilisable sans Streamlit.
+
+Les transformations sont une liste d'opérations en attente (recadrage,
+suppression de lignes...) composées puis exécutées une seule fois sur les
+images d'origine : un recadrage est une vue du tableau NumPy (aucune
+copie), les suppressions une seule concaténation. Les lots sont traités
+dans un pool de processus (le décodage et surtout l'encodage PNG dominent
+le temps). Utilisé par `pages/2_crop.py`.
+"""
+
+import atexit
+import hashlib
+import math
+import multiprocessing
+import os
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# ─────────────────────────────────────────────────────────────
+# CONFIGURATION
+# ─────────────────────────────────────────────────────────────
+NATIVE_MODES = ("RGB", "RGBA", "L", "LA")  # Modes gardés tels quels, les autres passent en RGBA
+PARALLEL_MIN_IMAGES = 2  # En dessous, le lot est traité dans le processus courant
+PREVIEW_MAX_WIDTH = 1200  # Largeur maximale de l'image affichée pour le recadrage interactif
+PREVIEW_MAX_PIXELS = 2_000_000
+ARTIFACT_MAX_ENTRIES = 4  # Archives gardées sur disque par session
+
+PngSettings = namedtuple("PngSettings", "compress_level optimize", defaults=(6, False))
+
+# Compromis vitesse / taille de l'encodage PNG (optimize implique le niveau 9)
+PNG_PRESETS = {
+    "rapide": PngSettings(compress_level=1),
+    "equilibre": PngSettings(compress_level=6),
+    "compact": PngSettings(compress_level=9, optimize=True),
+}
+
+
+# ─────────────────────────────────────────────────────────────
+# DÉCODAGE / ENCODAGE
+# ─────────────────────────────────────────────────────────────
+def load_pixels(data):
+    """PNG (bytes) -> tableau (hauteur, largeur[, canaux]) en uint8"""
+    img = Image.open(BytesIO(data))
+    if img.mode not in NATIVE_MODES:
+        img = img.convert("RGBA")
+    return np.asarray(img)
+
+
+def content_digest(data):
+    """Empreinte du contenu d'un fichier chargé, clé des caches de décodage"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def encode_png(pixels, settings=None):
+    """Tableau de pixels -> PNG (bytes), selon `settings` (PngSettings)"""
+    settings = settings or PngSettings()
+    buf = BytesIO()
+    Image.fromarray(np.ascontiguousarray(pixels)).save(
+        buf, format="PNG", compress_level=settings.compress_level, optimize=settings.optimize
+    )
+    return buf.getvalue()
+
+
+# ─────────────────────────────────────────────────────────────
+# TRANSFORMATIONS
+# ─────────────────────────────────────────────────────────────
+def crop_op(left, top, width, height):
+    """Opération de recadrage (coordonnées dans l'image produite par les opérations précédentes)"""
+    return ("crop", (left, top, width, height))
+
+
+def remove_rows_op(start, end):
+    """Opération de suppression des lignes [start, end) sur toute la largeur"""
+    return ("remove_rows", (start, end))
+
+
+def _select_rows(segments, start, end):
+    """Lignes [start, end) de l'image formée par `segments`, en segments de l'image d'origine"""
+    selected, offset = [], 0
+    for seg_start, seg_end in segments:
+        length = seg_end - seg_start
+        lo, hi = max(start - offset, 0), min(end - offset, length)
+        if hi > lo:
+            selected.append((seg_start + lo, seg_start + hi))
+        offset += length
+    return selected
+
+
+def plan_ops(ops, shape):
+    """Compose les opérations en (segments de lignes, colonnes) de l'image d'origine.
+
+    Les bornes sont ramenées dans l'image, comme pour un découpage de tableau.
+    """
+    rows = [(0, shape[0])]
+    col_start, col_end = 0, shape[1]
+    for name, args in ops:
+        if name == "crop":
+            left, top, width, height = args
+            col_start, col_end = (min(max(col_start + x, col_start), col_end) for x in (left, left + width))
+            rows = _select_rows(rows, max(top, 0), top + height)
+        elif name == "remove_rows":
+            start, end = args
+            rows = _select_rows(rows, 0, start) + _select_rows(rows, max(end, start), float("inf"))
+        else:
+            raise ValueError(f"opération inconnue : {name}")
+    return rows, (col_start, col_end)
+
+
+def apply_ops(pixels, ops):
+    """Exécute les opérations en une seule passe : une vue, ou une concaténation s'il y a des suppressions"""
+    rows, (col_start, col_end) = plan_ops(ops, pixels.shape)
+    parts = [pixels[start:end, col_start:col_end] for start, end in rows]
+    if len(parts) == 1:
+        return parts[0]
+    if not parts:
+        return pixels[:0, col_start:col_end]
+    return np.concatenate(parts, axis=0)
+
+
+def transform_png(data, ops, settings=None):
+    """Décode un PNG, applique les opérations, réencode"""
+    return encode_png(apply_ops(load_pixels(data), ops), settings)
+
+
+# ─────────────────────────────────────────────────────────────
+# PRÉVISUALISATION
+# ─────────────────────────────────────────────────────────────
+def make_proxy(pixels, max_width=PREVIEW_MAX_WIDTH, max_pixels=PREVIEW_MAX_PIXELS):
+    """Image réduite d'un facteur entier pour l'affichage, et ce facteur.
+
+    Les coordonnées saisies sur le proxy se ramènent à la pleine résolution
+    avec `scale_box`.
+    """
+    height, width = pixels.shape[:2]
+    factor = max(1, math.ceil(width / max_width), math.ceil(math.sqrt(width * height / max_pixels)))
+    img = Image.fromarray(np.ascontiguousarray(pixels))
+    return (img.reduce(factor) if factor > 1 else img), factor
+
+
+def scale_box(box, factor, shape=None):
+    """Boîte (left, top, width, height) du proxy -> pleine résolution, bornée à `shape`"""
+    left, top, width, height = (int(round(value * factor)) for value in box)
+    if shape is not None:
+        width = min(width, shape[1] - left)
+        height = min(height, shape[0] - top)
+    return left, top, width, height
+
+
+# ─────────────────────────────────────────────────────────────
+# TRAITEMENT PAR LOT
+# ─────────────────────────────────────────────────────────────
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def max_batch_workers():
+    return max(1, os.cpu_count() or 1)
+
+
+def get_executor():
+    """Pool de processus partagé, créé au premier lot et fermé à la sortie.
+
+    Les processus sont lancés en `spawn` : un fork du serveur Streamlit
+    (multi-thread) pourrait hériter de verrous tenus par d'autres threads.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=max_batch_workers(),
+                                            mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_executor.shutdown, cancel_futures=True)
+        return _executor
+
+
+def transform_batch(images, ops, settings=None):
+    """Applique les mêmes opérations à une liste de PNG (bytes).
+
+    Génère des couples (indice, PNG) dans l'ordre de fin de traitement, pour
+    suivre la progression ; l'appelant replace les résultats par indice.
+    """
+    if len(images) < PARALLEL_MIN_IMAGES or max_batch_workers() == 1:
+        for i, data in enumerate(images):
+            yield i, transform_png(data, ops, settings)
+        return
+    executor = get_executor()
+    futures = {executor.submit(transform_png, data, ops, settings): i
+               for i, data in enumerate(images)}
+    try:
+        for future in as_completed(futures):
+            # Retiré avant d'être rendu : les PNG déjà écrits ne restent pas en mémoire
+            i = futures.pop(future)
+            yield i, future.result()
+    except BrokenProcessPool:
+        # Un processus est mort (mémoire) : le prochain lot repartira d'un pool neuf
+        global _executor
+        with _executor_lock:
+            _executor = None
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def write_batch_zip(zipf, images, names, ops, settings=None, on_progress=None):
+    """Transforme le lot et écrit chaque image dans `zipf` dès qu'elle est prête.
+
+    Les résultats ne sont jamais tous en mémoire ; `on_progress(fait, total)`
+    est appelé après chaque image.
+    """
+    for done, (i, data) in enumerate(transform_batch(images, ops, settings), start=1):
+        zipf.writestr(names[i], data)
+        if on_progress:
+            on_progress(done, len(images))
+
+
+# ─────────────────────────────────────────────────────────────
+# CACHE D'ARCHIVES
+# ─────────────────────────────────────────────────────────────
+class ArtifactCache:
+    """Archives générées, une par clé (lot + opérations + compression), en fichiers temporaires.
+
+    Une archive est construite une seule fois puis resservie depuis le
+    disque tant que sa clé ne change pas ; au-delà de `max_entries`, les
+    plus anciennes sont supprimées.
+    """
+
+    def __init__(self, max_entries=ARTIFACT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._paths = OrderedDict()
+        self._lock = threading.Lock()
+        # Cache libéré (fin de session) ou sortie du processus : ses fichiers sont supprimés
+        weakref.finalize(self, _remove_all, self._paths)
+
+    def get(self, key):
+        """Chemin de l'archive de `key`, ou None si elle n'a pas été construite"""
+        with self._lock:
+            path = self._paths.get(key)
+            if path is not None and not os.path.exists(path):
+                del self._paths[key]
+                path = None
+            if path is not None:
+                self._paths.move_to_end(key)
+            return path
+
+    def build(self, key, write, suffix=".zip"):
+        """Construit l'archive avec `write(fichier)` et retourne son chemin"""
+        fd, path = tempfile.mkstemp(suffix=suffix, prefix="recadrage_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+        except BaseException:
+            os.remove(path)
+            raise
+        with self._lock:
+            old = self._paths.pop(key, None)
+            self._paths[key] = path
+            evicted = [old] if old else []
+            while len(self._paths) > self.max_entries:
+                evicted.append(self._paths.popitem(last=False)[1])
+        for old_path in evicted:
+            _remove_quietly(old_path)
+        return path
+
+    def clear(self):
+        with self._lock:
+            paths = list(self._paths.values())
+            self._paths.clear()
+        for path in paths:
+            _remove_quietly(path)
+
+
+def _remove_all(paths):
+    for path in list(paths.values()):
+        _remove_quietly(path)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
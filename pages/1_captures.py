@@ -53,34 +53,37 @@ else:
     # ============================================================
     # CODE ORIGINAL (Local uniquement)
     # ============================================================
-    import re
+    import json
     import time
-    import zipfile
-    import xml.etree.ElementTree as ET
-    from datetime import datetime
-    from io import BytesIO
-    from urllib.parse import urljoin, urlparse
+    import weakref
     
     import pandas as pd
-    import requests
-    from bs4 import BeautifulSoup
-    from selenium import webdriver
-    from selenium.common.exceptions import TimeoutException
-    from selenium.webdriver.chrome.options import Options
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.support import expected_conditions as EC
-    from selenium.webdriver.support.ui import WebDriverWait
     
-    # ─────────────────────────────────────────────────────────────
-    # ⚙️ CONFIGURATION
-    # ─────────────────────────────────────────────────────────────
-    COOKIE_BUTTON_SELECTOR = "button.cm-btn.cm-btn-success.cm-btn-info.cm-btn-accept"
+    from capture_pipeline import (
+        BLOCK_PROFILES,
+        CaptureManifest,
+        CRAWL_MAX_DEPTH,
+        CRAWL_MAX_PAGES,
+        DriverPool,
+        OUTPUT_FORMATS,
+        ResiliencePolicy,
+        VIEWPORT_HEIGHTS,
+        WINDOW_SIZE,
+        get_job,
+        list_jobs,
+        load_session,
+        max_capture_workers,
+        running_job,
+        save_session,
+        session_path,
+        submit_capture_job,
+    )
     
     # ─────────────────────────────────────────────────────────────
     # SESSION STATE
     # ─────────────────────────────────────────────────────────────
-    if "cookies_dict" not in st.session_state:
-        st.session_state.cookies_dict = None
+    if "session_cookies" not in st.session_state:
+        st.session_state.session_cookies = None
     if "logged_in" not in st.session_state:
         st.session_state.logged_in = False
     if "login_driver" not in st.session_state:
@@ -95,145 +98,57 @@ else:
         st.session_state.show_folder_picker = False
     if "current_path" not in st.session_state:
         st.session_state.current_path = os.path.expanduser("~")
+    if "driver_pool" not in st.session_state:
+        st.session_state.driver_pool = None
+    if "consent_memory" not in st.session_state:
+        st.session_state.consent_memory = {}
+    if "capture_job_id" not in st.session_state:
+        st.session_state.capture_job_id = None
+    
+    # ─────────────────────────────────────────────────────────────
+    # POOL DE NAVIGATEURS
+    # ─────────────────────────────────────────────────────────────
+    class SessionEndGuard:
+        """Objet rangé dans st.session_state : il n'est libéré qu'avec la session elle-même"""
+    
+    def get_driver_pool():
+        """Retourne le pool de la session, fermé automatiquement en fin de session"""
+        pool = st.session_state.driver_pool
+        if pool is None:
+            pool = DriverPool()
+            st.session_state.driver_pool = pool
+            # Les navigateurs encore empruntés par une tâche sont fermés à leur retour
+            guard = SessionEndGuard()
+            st.session_state.driver_pool_guard = guard
+            weakref.finalize(guard, pool.close)
+        return pool
     
     # ─────────────────────────────────────────────────────────────
     # OUTILS
     # ─────────────────────────────────────────────────────────────
     def start_login(base_url):
         """Lance un navigateur pour que l'utilisateur se connecte"""
-        o = Options()
-        o.add_argument("--no-sandbox")
-        o.add_argument("--disable-gpu")
-        
-        driver = webdriver.Chrome(options=o)
-        driver.set_window_size(1920, 1080)
+        driver = get_driver_pool().acquire(headless=False)
         driver.get(base_url)
         
         st.session_state.login_driver = driver
         return driver
     
-    def finish_login():
-        """Récupère les cookies après la connexion"""
+    def finish_login(base_url):
+        """Récupère les cookies complets après la connexion et enregistre la session sur disque"""
         if st.session_state.login_driver:
             try:
-                cookies_list = st.session_state.login_driver.get_cookies()
-                cookies_dict = {cookie['name']: cookie['value'] for cookie in cookies_list}
-                st.session_state.login_driver.quit()
+                cookies = st.session_state.login_driver.get_cookies()
+                # Fenêtre visible : jamais réutilisée par les captures (headless), donc fermée
+                get_driver_pool().release(st.session_state.login_driver, recycle=True)
                 st.session_state.login_driver = None
-                return cookies_dict
+                save_session(cookies, session_path(base_url))
+                return cookies
             except Exception as e:
                 st.error(f"Erreur lors de la récupération des cookies: {e}")
                 return None
         return None
     
-    def discover_site_pages(base_url):
-        """Découvre automatiquement les pages du site"""
-        pages = []
-        
-        try:
-            # Essayer via sitemap
-            sitemap_url = urljoin(base_url, '/sitemap.xml')
-            response = requests.get(sitemap_url, timeout=5)
-            
-            if response.status_code == 200:
-                root = ET.fromstring(response.content)
-                namespace = {'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
-                
-                for url_elem in root.findall('ns:url', namespace):
-                    loc = url_elem.find('ns:loc', namespace)
-                    if loc is not None:
-                        url = loc.text
-                        parsed = urlparse(url)
-                        path = parsed.path
-                        if path.startswith('/'):
-                            path = path[1:]
-                        pages.append(path)
-                
-                return sorted(set(pages))
-        except:
-            pass
-        
-        # Fallback: scanner la page d'accueil
-        try:
-            response = requests.get(base_url, timeout=5)
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            for link in soup.find_all('a', href=True):
-                href = link['href']
-                if href.startswith('/'):
-                    path = href[1:]
-                    if path and not path.endswith(('jpg', 'png', 'pdf', 'css', 'js')):
-                        pages.append(path)
-        except:
-            pass
-        
-        return sorted(set(pages))
-    
-    def capture_screens(pages, base_url, authenticated=False, out_dir="captures", cookies=None, log=None):
-        """Capture les pages web"""
-        if log is None:
-            log = []
-        
-        for page in pages:
-            try:
-                o = Options()
-                o.add_argument("--no-sandbox")
-                o.add_argument("--disable-gpu")
-                o.add_argument("--headless")
-                
-                driver = webdriver.Chrome(options=o)
-                driver.set_window_size(1920, 1080)
-                
-                url = urljoin(base_url, page)
-                
-                if authenticated and cookies:
-                    driver.get(url)
-                    for name, value in cookies.items():
-                        try:
-                            driver.add_cookie({'name': name, 'value': value})
-                        except:
-                            pass
-                
-                driver.get(url)
-                time.sleep(2)
-                
-                # Essayer d'accepter les cookies
-                try:
-                    button = WebDriverWait(driver, 3).until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, COOKIE_BUTTON_SELECTOR))
-                    )
-                    button.click()
-                    time.sleep(1)
-                except:
-                    pass
-                
-                # Créer le dossier
-                os.makedirs(out_dir, exist_ok=True)
-                
-                # Screenshot
-                filename = f"{out_dir}/{page.replace('/', '_')}.png"
-                driver.save_screenshot(filename)
-                
-                log.append({
-                    "Page": page,
-                    "URL": url,
-                    "Status": "Captured",
-                    "Time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
-                
-                st.success(f"✅ Capturée: {page}")
-                
-                driver.quit()
-                
-            except Exception as e:
-                log.append({
-                    "Page": page,
-                    "URL": urljoin(base_url, page),
-                    "Status": f"Error: {str(e)[:50]}",
-                    "Time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
-                st.warning(f"⚠️  Erreur: {page}")
-    
     # ─────────────────────────────────────────────────────────────
     # INTERFACE
     # ─────────────────────────────────────────────────────────────
@@ -247,24 +162,225 @@ else:
         st.rerun()
     
     if st.button("✅ J'ai termine"):
-        cookies = finish_login()
+        cookies = finish_login(base_url)
         if cookies:
-            st.session_state.cookies_dict = cookies
+            st.session_state.session_cookies = cookies
             st.session_state.logged_in = True
             st.rerun()
     
+    saved_session = None if st.session_state.logged_in else load_session(session_path(base_url))
+    if saved_session and st.button("🔑 Reprendre la session enregistree"):
+        st.session_state.session_cookies = saved_session
+        st.session_state.logged_in = True
+        st.rerun()
+    
     if st.session_state.logged_in:
         st.success("✅ Connecte !")
+        if st.button("🚪 Oublier la session"):
+            if os.path.exists(session_path(base_url)):
+                os.remove(session_path(base_url))
+            st.session_state.session_cookies = None
+            st.session_state.logged_in = False
+            st.rerun()
     
-    if st.button("📸 Lancer les captures"):
-        with st.spinner("Decouverte des pages..."):
-            pages = discover_site_pages(base_url)
-        
-        st.info(f"Pages trouvees: {len(pages)}")
+    machine_workers = max_capture_workers()
+    workers = st.number_input(
+        "Navigateurs en parallele",
+        min_value=1,
+        max_value=machine_workers,
+        value=min(4, machine_workers)
+    )
+    if machine_workers < (os.cpu_count() or 1):
+        st.caption(f"Limite a {machine_workers} navigateurs par la memoire disponible")
+    
+    preflight = st.checkbox(
+        "Pre-verification HTTP avant capture",
+        value=True,
+        help="Ecarte les 404, les contenus non HTML et les doublons (redirections, rel=canonical)"
+    )
+    
+    incremental = st.checkbox(
+        "Mode incremental (ne recapturer que les pages modifiees)",
+        help="Conserve la capture precedente si la page n'a pas change depuis le dernier passage"
+    )
+    
+    viewports = st.multiselect(
+        "Largeurs d'ecran",
+        list(VIEWPORT_HEIGHTS),
+        default=[WINDOW_SIZE[0]],
+        help="Chaque page est chargee une fois puis capturee a chaque largeur"
+    )
+    
+    full_page = st.checkbox("Capturer toute la hauteur des pages")
+    
+    output_format = st.selectbox(
+        "Format des captures",
+        list(OUTPUT_FORMATS),
+        help="Le PNG est ecrit tel que fourni par le navigateur ; les autres formats sont reencodes"
+    )
+    
+    export_zip = st.checkbox(
+        "Exporter en ZIP avec rapport Excel",
+        value=True,
+        help="Les captures sont ajoutees a l'archive au fur et a mesure, sans la garder en memoire"
+    )
+    
+    block_profile = st.selectbox(
+        "Blocage des ressources",
+        list(BLOCK_PROFILES),
+        help="'mise en page' bloque images, polices, videos et traceurs pour accelerer le chargement"
+    )
+    
+    with st.expander("Options de decouverte (sans sitemap)"):
+        crawl_depth = st.number_input("Profondeur maximale", min_value=0, value=CRAWL_MAX_DEPTH)
+        crawl_pages = st.number_input("Nombre maximal de pages", min_value=1, value=CRAWL_MAX_PAGES)
+    
+    with st.expander("Delais et nouvelles tentatives"):
+        default_policy = ResiliencePolicy()
+        page_timeout = st.number_input("Delai de chargement maximal (s)", min_value=1,
+                                       value=default_policy.page_load_timeout)
+        retries = st.number_input("Nouvelles tentatives sur erreur transitoire", min_value=0,
+                                  value=default_policy.retries)
+        breaker_threshold = st.number_input(
+            "Pages consecutives en echec avant de couper le site",
+            min_value=1,
+            value=default_policy.breaker_threshold
+        )
+        breaker_abort = st.checkbox(
+            "Abandonner les pages restantes du site coupe",
+            help="Sinon, les captures font une pause avant de reessayer le site"
+        )
+    
+    manifest = CaptureManifest("captures")
+    counts = manifest.counts()
+    # Une tâche d'une autre session peut écrire dans le même dossier
+    busy = running_job("captures") is not None
+    resume = False
+    if not busy and (counts.get("pending") or counts.get("in_progress") or counts.get("failed")):
+        st.warning(
+            f"Execution precedente incomplete : {counts.get('captured', 0)} capturees, "
+            f"{counts.get('pending', 0) + counts.get('in_progress', 0)} restantes, "
+            f"{counts.get('failed', 0)} en echec"
+        )
+        resume = st.checkbox("Reprendre la ou l'execution precedente s'est arretee", value=True)
+    
+    run = st.button("📸 Lancer les captures", disabled=busy)
+    retry = not busy and counts.get("failed") and st.button("🔁 Reessayer uniquement les pages en echec")
+    
+    if run or retry:
+        pages = None
+        if retry:
+            pages = manifest.pages(["failed"])
+        elif resume:
+            pages = manifest.pages()
         
-        log = []
-        capture_screens(pages[:5], base_url, False, "captures", log=log)
+        try:
+            job = submit_capture_job(
+                base_url, pages, limit=5,
+                discover_options={"max_depth": crawl_depth, "max_pages": crawl_pages},
+                preflight=preflight,
+                export_zip=export_zip,
+                authenticated=st.session_state.logged_in,
+                cookies=st.session_state.session_cookies,
+                out_dir="captures",
+                pool=get_driver_pool(), workers=workers,
+                consent_memory=st.session_state.consent_memory,
+                incremental=incremental, manifest=manifest,
+                retry_failed=bool(retry),
+                block=BLOCK_PROFILES[block_profile],
+                viewports=viewports if viewports != [WINDOW_SIZE[0]] else None,
+                full_page=full_page,
+                output=OUTPUT_FORMATS[output_format],
+                policy=ResiliencePolicy(page_load_timeout=page_timeout, retries=retries,
+                                        breaker_threshold=breaker_threshold, breaker_abort=breaker_abort),
+                reset_manifest=not (retry or resume)
+            )
+        except RuntimeError as e:
+            st.error(f"Impossible de lancer les captures : {e}")
+        else:
+            st.session_state.capture_job_id = job.id
+            st.rerun()
+    
+    # ─────────────────────────────────────────────────────────────
+    # SUIVI DE LA TÂCHE EN COURS
+    # ─────────────────────────────────────────────────────────────
+    jobs = list_jobs()
+    if jobs:
+        with st.expander("Taches de capture"):
+            labels = {job.id: f"{job.id} - {job.base_url} ({job.status}, {job.created_at})" for job in jobs}
+            ids = list(labels)
+            current = st.session_state.capture_job_id
+            selected = st.selectbox(
+                "Se rattacher a une tache",
+                ids,
+                index=ids.index(current) if current in ids else 0,
+                format_func=labels.get
+            )
+            if selected != current:
+                st.session_state.capture_job_id = selected
+                st.rerun()
+    
+    job = get_job(st.session_state.capture_job_id) if st.session_state.capture_job_id else None
+    if job is not None:
+        if job.phase == "discovery":
+            st.info("Decouverte des pages...")
+        elif job.phase == "preflight":
+            st.info("Pre-verification HTTP des pages...")
+        elif job.total:
+            st.progress(job.done / job.total, text=f"{job.done}/{job.total} pages")
         
+        log = job.log()
         if log:
             df = pd.DataFrame(log)
             st.dataframe(df)
+        
+        if job.skipped:
+            with st.expander(f"{len(job.skipped)} pages ecartees par la pre-verification"):
+                st.dataframe(pd.DataFrame(job.skipped))
+        
+        if job.running:
+            if st.button("⏹️ Annuler la tache"):
+                job.cancel()
+            time.sleep(1)
+            st.rerun()
+        elif job.status == "failed":
+            st.error(f"Erreur: {job.error}")
+        elif job.status == "cancelled":
+            st.warning("Tache annulee : les pages restantes pourront etre reprises.")
+        else:
+            st.success("🎉 Captures terminees")
+        
+        if job.archive_path and os.path.exists(job.archive_path):
+            with open(job.archive_path, "rb") as archive:
+                st.download_button(
+                    "📦 Telecharger les captures et le rapport (ZIP)",
+                    archive,
+                    file_name=os.path.basename(job.archive_path),
+                    mime="application/zip"
+                )
+        
+        if job.report:
+            with st.expander("⏱️ Temps par phase (p50 / p95)"):
+                st.dataframe(pd.DataFrame(job.report["phases"]).T)
+                st.json(job.report["discovery"])
+                if "output" in job.report:
+                    st.write(
+                        f"{job.report['output']['raw_kb']} Ko bruts -> "
+                        f"{job.report['output']['output_kb']} Ko ecrits"
+                    )
+                if "resources" in job.report:
+                    st.write(
+                        f"{job.report['resources']['blocked_requests']} requetes bloquees, "
+                        f"{job.report['resources']['transferred_kb']} Ko transferes"
+                    )
+            col1, col2 = st.columns(2)
+            col1.download_button(
+                "📊 Rapport de temps (JSON)",
+                json.dumps(job.report, ensure_ascii=False, indent=2),
+                file_name="timing_report.json"
+            )
+            col2.download_button(
+                "📊 Temps par page (CSV)",
+                pd.DataFrame(log).to_csv(index=False),
+                file_name="timings.csv"
+            )
@@ -1,11 +1,24 @@
 import streamlit as st
-from PIL import Image
 from io import BytesIO
 from datetime import datetime
+import numpy as np
 import pandas as pd
 import zipfile
 from streamlit_cropper import st_cropper
 
+from crop_pipeline import (
+    PNG_PRESETS,
+    ArtifactCache,
+    apply_ops,
+    content_digest,
+    crop_op,
+    load_pixels,
+    make_proxy,
+    remove_rows_op,
+    scale_box,
+    write_batch_zip,
+)
+
 # ⚠️ Ne pas ajouter st.set_page_config() - déjà fait dans app.py
 # st.set_page_config(page_title="✂️ Recadrage + Suppression", layout="wide")
 
@@ -14,18 +27,25 @@ st.title("✂️ Recadrage puis suppression d'une zone (traitement par lot)")
 # -----------------------------
 # INIT SESSION
 # -----------------------------
+# Les opérations validées sont seulement enregistrées : elles sont exécutées
+# une seule fois, depuis les images d'origine, au moment du téléchargement.
 if "step" not in st.session_state:
     st.session_state.step = 1
-if "cropped_images" not in st.session_state:
-    st.session_state.cropped_images = None
+if "ops" not in st.session_state:
+    st.session_state.ops = []
 if "crop_box" not in st.session_state:
     st.session_state.crop_box = None
+if "artifacts" not in st.session_state:
+    # Archives construites une fois par lot + opérations, servies depuis le disque
+    # (fichiers supprimés quand la session, et donc le cache, est libérée)
+    st.session_state.artifacts = ArtifactCache()
 
 # -----------------------------
 # Restart bouton
 # -----------------------------
 if st.button("🔄 Recommencer depuis zéro"):
-    for k in ["step", "cropped_images", "crop_box"]:
+    st.session_state.artifacts.clear()
+    for k in ["step", "ops", "crop_box"]:
         st.session_state.pop(k, None)
     st.session_state.step = 1
     st.rerun()
@@ -43,9 +63,65 @@ if not uploaded_files:
     st.info("📥 Charge au moins une image.")
     st.stop()
 
-ref_file = uploaded_files[0]
-ref_img_orig = Image.open(ref_file).convert("RGBA")
-orig_w, orig_h = ref_img_orig.size
+compression = st.selectbox(
+    "🗜️ Compression PNG",
+    list(PNG_PRESETS),
+    index=1,
+    help="'rapide' encode plusieurs fois plus vite, 'compact' produit les fichiers les plus petits"
+)
+png_settings = PNG_PRESETS[compression]
+
+
+# -----------------------------
+# IMAGE DE RÉFÉRENCE (cache)
+# -----------------------------
+# Chaque déplacement du cadre relance le script : l'image de référence est
+# décodée une fois par contenu, et le recadrage interactif se fait sur un
+# proxy réduit dont les coordonnées sont ramenées à la pleine résolution.
+@st.cache_resource(max_entries=4, show_spinner=False)
+def decode_reference(digest, _data):
+    pixels = load_pixels(_data)
+    pixels.setflags(write=False)  # Partagé entre les sessions
+    return pixels
+
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def reference_proxy(digest, ops, _pixels):
+    """Proxy de la référence après les opérations validées, et son facteur de réduction"""
+    return make_proxy(apply_ops(_pixels, list(ops)))
+
+
+ref_data = uploaded_files[0].getvalue()
+ref_digest = content_digest(ref_data)
+ref_pixels = decode_reference(ref_digest, ref_data)
+
+
+def output_names(suffix):
+    return [f.name.replace(".png", suffix) for f in uploaded_files]
+
+
+def artifact_key(kind, ops):
+    """Clé d'une archive : change avec le lot chargé, les opérations ou la compression"""
+    batch = tuple((f.file_id, f.name, f.size) for f in uploaded_files)
+    return kind, batch, tuple(ops), png_settings
+
+
+def build_zip(out, ops, names, progress_text, extra_files=None):
+    """Exécute les opérations sur les images d'origine et écrit le ZIP dans `out`"""
+    progress = st.progress(0.0, text=progress_text)
+    with zipfile.ZipFile(out, "w") as zipf:
+        write_batch_zip(
+            zipf, [f.getvalue() for f in uploaded_files], names, ops, png_settings,
+            on_progress=lambda done, total: progress.progress(done / total, text=f"{done}/{total} images")
+        )
+        for name, data in (extra_files or {}).items():
+            zipf.writestr(name, data)
+
+
+def download_artifact(label, path, file_name):
+    with open(path, "rb") as f:
+        st.download_button(label, f, file_name=file_name, mime="application/zip")
+
 
 # ==========================================================
 # ÉTAPE 1 : RECADRAGE
@@ -55,9 +131,10 @@ if st.session_state.step == 1:
     st.markdown("## 1️⃣ Étape 1 : Recadrer les images")
     st.write("🎯 Recadre la première image. Ce recadrage sera appliqué à toutes les images.")
 
-    # Zone de recadrage
+    # Zone de recadrage (sur le proxy)
+    proxy_img, factor = reference_proxy(ref_digest, (), ref_pixels)
     crop_box = st_cropper(
-        ref_img_orig,
+        proxy_img,
         realtime_update=True,
         box_color='#00FF00',
         aspect_ratio=None,
@@ -66,54 +143,38 @@ if st.session_state.step == 1:
     )
 
     if crop_box:
-        left_c = int(crop_box["left"])
-        top_c = int(crop_box["top"])
-        width_c = int(crop_box["width"])
-        height_c = int(crop_box["height"])
+        proxy_box = tuple(int(crop_box[k]) for k in ("left", "top", "width", "height"))
+        left_c, top_c, width_c, height_c = scale_box(proxy_box, factor, ref_pixels.shape)
 
         st.success(f"✂️ Zone de recadrage : x={left_c}, y={top_c}, w={width_c}, h={height_c}")
 
-        # Preview
-        preview_crop = ref_img_orig.crop((left_c, top_c, left_c + width_c, top_c + height_c))
+        # Preview (vue sur le proxy, sans copie)
+        crop_box = (left_c, top_c, width_c, height_c)
+        preview_crop = apply_ops(np.asarray(proxy_img), [crop_op(*proxy_box)])
         st.image(preview_crop, caption="Prévisualisation recadrée", use_container_width=True)
 
         # -----------------------------------------
-        # Appliquer le recadrage à toutes les images
+        # Valider le recadrage (appliqué au téléchargement)
         # -----------------------------------------
-        if st.button("✅ Valider le recadrage et générer les images recadrées"):
-            cropped_images = []
-
-            for f in uploaded_files:
-                img = Image.open(f).convert("RGBA")
-                cropped = img.crop((left_c, top_c, left_c + width_c, top_c + height_c))
-
-                buf = BytesIO()
-                cropped.save(buf, format="PNG")
-                cropped_images.append({
-                    "name": f.name,
-                    "bytes": buf.getvalue()
-                })
+        if st.button("✅ Valider le recadrage"):
+            st.session_state.ops = [crop_op(*crop_box)]
+            st.session_state.crop_box = crop_box
 
-            st.session_state.cropped_images = cropped_images
-            st.session_state.crop_box = (left_c, top_c, width_c, height_c)
-
-            st.success("🎉 Recadrage appliqué à toutes les images !")
+            st.success(f"🎉 Recadrage validé pour les {len(uploaded_files)} images !")
 
     # -----------------------------------------
     # Télécharger uniquement les images recadrées
     # -----------------------------------------
-    if st.session_state.cropped_images:
+    if st.session_state.ops:
         st.markdown("### 📥 Télécharger les images recadrées (sans suppression)")
-        zip_buffer = BytesIO()
-        with zipfile.ZipFile(zip_buffer, "w") as zipf:
-            for item in st.session_state.cropped_images:
-                zipf.writestr(item["name"].replace(".png", "_recadre.png"), item["bytes"])
-        zip_buffer.seek(0)
-        st.download_button(
-            "📦 Télécharger uniquement les images recadrées",
-            zip_buffer.getvalue(),
-            file_name="images_recadrees.zip"
-        )
+        key = artifact_key("recadrees", st.session_state.ops)
+        path = st.session_state.artifacts.get(key)
+        if path is None and st.button("⚙️ Générer les images recadrées"):
+            path = st.session_state.artifacts.build(
+                key, lambda f: build_zip(f, st.session_state.ops, output_names("_recadre.png"), "Recadrage...")
+            )
+        if path is not None:
+            download_artifact("📦 Télécharger uniquement les images recadrées", path, "images_recadrees.zip")
 
         # Passer à l'étape 2
         if st.button("➡️ Passer à l'étape 2 : suppression d'une zone"):
@@ -128,13 +189,13 @@ elif st.session_state.step == 2:
     st.markdown("## 2️⃣ Étape 2 : Suppression d'une zone horizontale")
     st.write("Dessine une zone à supprimer sur la première image recadrée.")
 
-    first_crop = st.session_state.cropped_images[0]
-    ref_cropped_img = Image.open(BytesIO(first_crop["bytes"])).convert("RGBA")
-    cw, ch = ref_cropped_img.size
+    # Proxy de l'image de référence recadrée (calculé une fois par recadrage)
+    proxy_img, factor = reference_proxy(ref_digest, tuple(st.session_state.ops), ref_pixels)
+    cropped_shape = apply_ops(ref_pixels, st.session_state.ops).shape
 
     # Zone à supprimer
     box = st_cropper(
-        ref_cropped_img,
+        proxy_img,
         realtime_update=True,
         box_color='#FF0000',
         aspect_ratio=None,
@@ -143,69 +204,47 @@ elif st.session_state.step == 2:
     )
 
     if box:
-        left = int(box["left"])
-        top = int(box["top"])
-        width = int(box["width"])
-        height = int(box["height"])
+        proxy_box = tuple(int(box[k]) for k in ("left", "top", "width", "height"))
+        left, top, width, height = scale_box(proxy_box, factor, cropped_shape)
 
         st.success(f"🚨 Zone à supprimer : x={left}, y={top}, w={width}, h={height}")
 
-        # Preview suppression
-        top_part = ref_cropped_img.crop((0, 0, cw, top))
-        bottom_part = ref_cropped_img.crop((0, top + height, cw, ch))
-        new_h_prev = top_part.height + bottom_part.height
-
-        preview_clean = Image.new("RGBA", (cw, new_h_prev))
-        preview_clean.paste(top_part, (0, 0))
-        preview_clean.paste(bottom_part, (0, top_part.height))
+        # Preview suppression (sur le proxy)
+        ops = st.session_state.ops + [remove_rows_op(top, top + height)]
+        preview_clean = apply_ops(
+            np.asarray(proxy_img), [remove_rows_op(proxy_box[1], proxy_box[1] + proxy_box[3])]
+        )
 
         st.image(preview_clean, caption="Prévisualisation après suppression", use_container_width=True)
 
-        # Traitement
-        if st.button("🚀 Supprimer cette zone sur toutes les images recadrées"):
-            zip_buffer = BytesIO()
-            logs = []
-
-            with zipfile.ZipFile(zip_buffer, "w") as zipf:
-
-                for item in st.session_state.cropped_images:
-                    img = Image.open(BytesIO(item["bytes"])).convert("RGBA")
-                    W, H = img.size
-
-                    top_part = img.crop((0, 0, W, top))
-                    bottom_part = img.crop((0, top + height, W, H))
-                    new_h = top_part.height + bottom_part.height
-
-                    out_img = Image.new("RGBA", (W, new_h))
-                    out_img.paste(top_part, (0, 0))
-                    out_img.paste(bottom_part, (0, top_part.height))
-
-                    out_name = item["name"].replace(".png", "_recadre_cleaned.png")
-                    img_bytes = BytesIO()
-                    out_img.save(img_bytes, "PNG")
-                    img_bytes.seek(0)
-                    zipf.writestr(out_name, img_bytes.getvalue())
-
-                    logs.append({
-                        "Image source": item["name"],
-                        "Image finale": out_name,
-                        "Recadrage": str(st.session_state.crop_box),
-                        "Zone supprimée": f"{left},{top},{width},{height}",
-                        "Date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    })
-
-                # Log Excel
-                df = pd.DataFrame(logs)
-                excel_bytes = BytesIO()
-                df.to_excel(excel_bytes, index=False)
-                excel_bytes.seek(0)
-                zipf.writestr("log_operations.xlsx", excel_bytes.getvalue())
-
-            zip_buffer.seek(0)
-
-            st.success("🎉 Traitement terminé.")
-            st.download_button(
-                "📦 Télécharger les images finales (ZIP)",
-                zip_buffer.getvalue(),
-                file_name="images_recadrees_et_nettoyees.zip"
+        # Traitement : recadrage + suppression en une seule passe depuis les originaux
+        key = artifact_key("finales", ops)
+        path = st.session_state.artifacts.get(key)
+        if path is None and st.button("🚀 Supprimer cette zone sur toutes les images recadrées"):
+            names = output_names("_recadre_cleaned.png")
+            date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            logs = [
+                {
+                    "Image source": f.name,
+                    "Image finale": name,
+                    "Recadrage": str(st.session_state.crop_box),
+                    "Zone supprimée": f"{left},{top},{width},{height}",
+                    "Date": date
+                }
+                for f, name in zip(uploaded_files, names)
+            ]
+
+            # Log Excel
+            df = pd.DataFrame(logs)
+            excel_bytes = BytesIO()
+            df.to_excel(excel_bytes, index=False)
+
+            path = st.session_state.artifacts.build(
+                key, lambda f: build_zip(f, ops, names, "Recadrage et suppression...",
+                                         {"log_operations.xlsx": excel_bytes.getvalue()})
             )
+            st.success("🎉 Traitement terminé.")
+
+        if path is not None:
+            download_artifact("📦 Télécharger les images finales (ZIP)", path,
+                              "images_recadrees_et_nettoyees.zip")